@@ -1,98 +1,461 @@
-import requests
-
-BASE_URL = 'https://store.4gmobiles.com'
+import asyncio
+import codecs
+import json
+import time
+from contextlib import aclosing
+from urllib.parse import urlsplit
+import httpx
+from cache import cached
+from breaker import endpoint_health
+from metrics import observe_upstream, endpoint_name
+from models import Category, Subcategory, Brand, Model, Item, Stock, Request, Message, loads, decode
+from config import (STORE_BASE_URL, STORE_TIMEOUT, STORE_CONNECT_TIMEOUT, STORE_MAX_CONNECTIONS, STORE_MAX_KEEPALIVE,
+STORE_RETRIES, STORE_RETRY_BACKOFF, STORE_PAGE_SIZE, INLINE_DETAIL_CONCURRENCY, INLINE_LATENCY_BUDGET, SEARCH_MAX_RESULTS)
+
+BASE_URL = STORE_BASE_URL
+
+# Shared keep-alive connection pool, created on first use
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        # All calls go to a single host, so the pool limits are per-host limits
+        limits = httpx.Limits(max_connections=STORE_MAX_CONNECTIONS, max_keepalive_connections=STORE_MAX_KEEPALIVE)
+        _client = httpx.AsyncClient(
+            base_url=BASE_URL,
+            timeout=httpx.Timeout(STORE_TIMEOUT, connect=STORE_CONNECT_TIMEOUT),
+            limits=limits,
+        )
+    return _client
+
+# Close the shared client, e.g. from the application's post_shutdown hook
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+# Timeouts for one call: the adaptive read timeout, while waiting for a free
+# connection in the local pool keeps the fixed limit
+
+
+def _timeout(health):
+    return httpx.Timeout(health.timeout(), connect=STORE_CONNECT_TIMEOUT, pool=STORE_TIMEOUT)
+
+# Trace hook noting when a request starts going out, i.e. after the pool wait
+# and the connect. Latencies are measured from there, so a busy local pool
+# does not look like a slow store.
+
+
+def _request_timer():
+    sent = {}
+
+    async def trace(event, info):
+        if event.endswith('send_request_headers.started'):
+            sent.setdefault('at', time.perf_counter())
+
+    return sent, {'trace': trace}
+
+# One GET attempt with the endpoint's adaptive read timeout; None when no response arrived.
+# The outcome is reported to the endpoint's breaker, except for waits on the local pool.
+
+
+async def _attempt(path, params, health):
+    sent, extensions = _request_timer()
+    start = time.perf_counter()
+    try:
+        response = await get_client().get(path, params=params, timeout=_timeout(health), extensions=extensions)
+    except httpx.PoolTimeout:
+        health.pool_timeouts += 1
+        return None
+    except httpx.TransportError:
+        observe_upstream('GET', path, None, time.perf_counter() - sent.get('at', start))
+        health.breaker.record_failure()
+        return None
+    elapsed = time.perf_counter() - sent.get('at', start)
+    observe_upstream('GET', path, response.status_code, elapsed)
+    health.latencies.observe(elapsed)
+    if response.status_code >= 500:
+        health.breaker.record_failure()
+    else:
+        health.breaker.record_success()
+    return response
+
+# GET attempt that sends a second copy when the first is slower than usual and
+# keeps whichever answers first; only for idempotent GETs
+
+
+async def _hedged_attempt(path, params, health):
+    tasks = [asyncio.create_task(_attempt(path, params, health))]
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=health.hedge_delay())
+        if not done:
+            health.hedged += 1
+            tasks.append(asyncio.create_task(_attempt(path, params, health)))
+            pending = set(tasks)
+        response = None
+        while True:
+            for task in done:
+                response = task.result()
+                if response is not None and response.status_code < 500:
+                    if task is not tasks[0]:
+                        health.hedge_wins += 1
+                    return response
+            if not pending:
+                return response
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+# GET a path, retrying connection errors and 5xx responses with exponential backoff,
+# and decode the body into records of the given type.
+# While the endpoint's circuit is open the default is returned at once, so callers
+# fall back to cached data instead of waiting on a failing store.
+
+
+async def _get(path, default, params=None, hedge=False, record=None):
+    health = endpoint_health('GET', path)
+    health.requests += 1
+    for attempt in range(STORE_RETRIES + 1):
+        last_attempt = attempt == STORE_RETRIES
+        if not health.breaker.allow():
+            health.shed += 1
+            return default
+        response = await (_hedged_attempt if hedge else _attempt)(path, params, health)
+        if response is None or response.status_code >= 500:
+            if last_attempt:
+                return default
+        else:
+            if response.status_code != 200:
+                return default
+            body = loads(response.content)
+            return decode(record, body) if record is not None else body
+        await asyncio.sleep(STORE_RETRY_BACKOFF * 2 ** attempt)
+
+
+class StoreUnavailable(Exception):
+    """A listing could not be read completely from the store."""
+
+
+_json_decoder = json.JSONDecoder()
+
+
+def _skip_separators(text, pos):
+    while pos < len(text) and text[pos] in ' \t\r\n,':
+        pos += 1
+    return pos
+
+# Parse a listing body as it arrives: records of a top-level JSON array are
+# yielded one by one, a paginated page ({"results": [...], "next": url}) is
+# parsed whole and its next link stored in cursor
+
+
+async def _parse_listing(chunks, cursor):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    array = None
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        if array is None:
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            array = stripped[0] == '['
+            if array:
+                buffer = stripped[1:]
+        if not array:
+            continue
+        pos = 0
+        while True:
+            pos = _skip_separators(buffer, pos)
+            if buffer.startswith(']', pos):
+                return
+            try:
+                record, end = _json_decoder.raw_decode(buffer, pos)
+            except ValueError:
+                break
+            # A value that ends the buffer may be cut short (e.g. a number), so wait for what follows it
+            if end == len(buffer):
+                break
+            yield record
+            pos = end
+        buffer = buffer[pos:]
+
+    buffer += decoder.decode(b'', final=True)
+    if array:
+        raise StoreUnavailable("listing ended before its closing bracket")
+    body = loads(buffer)
+    if not isinstance(body, dict) or not isinstance(body.get('results'), list):
+        raise StoreUnavailable("listing is neither an array nor a page of results")
+    cursor['next'] = body.get('next')
+    for record in body['results']:
+        yield record
+
+# Stream the records of one listing response, retrying like _get until the
+# first record has been yielded
+
+
+async def _stream_records(url, params, cursor):
+    path = urlsplit(url).path
+    health = endpoint_health('GET', path)
+    health.requests += 1
+    for attempt in range(STORE_RETRIES + 1):
+        if not health.breaker.allow():
+            health.shed += 1
+            raise StoreUnavailable(f"circuit for GET {endpoint_name(path)} is open")
+        sent, extensions = _request_timer()
+        start = time.perf_counter()
+        yielded = False
+        try:
+            async with get_client().stream('GET', url, params=params, timeout=_timeout(health),
+                                           extensions=extensions) as response:
+                elapsed = time.perf_counter() - sent.get('at', start)
+                observe_upstream('GET', path, response.status_code, elapsed)
+                if response.status_code < 500:
+                    health.breaker.record_success()
+                    health.latencies.observe(elapsed)
+                    if response.status_code != 200:
+                        raise StoreUnavailable(f"GET {path} returned {response.status_code}")
+                    async for record in _parse_listing(response.aiter_bytes(), cursor):
+                        yielded = True
+                        yield record
+                    return
+                health.breaker.record_failure()
+        except httpx.PoolTimeout as e:
+            # No connection was free locally; the store itself was never asked
+            health.pool_timeouts += 1
+            if attempt == STORE_RETRIES:
+                raise StoreUnavailable(f"GET {path} found no free connection: {e!r}") from e
+        except httpx.TransportError as e:
+            if not yielded:
+                observe_upstream('GET', path, None, time.perf_counter() - sent.get('at', start))
+            health.breaker.record_failure()
+            # Records already handed out cannot be taken back, so a broken stream is not retried
+            if yielded or attempt == STORE_RETRIES:
+                raise StoreUnavailable(f"GET {path} failed: {e!r}") from e
+        except ValueError as e:
+            # Not JSON or not UTF-8, e.g. an HTML error page from a proxy
+            raise StoreUnavailable(f"GET {path} sent an unreadable listing: {e!r}") from e
+        else:
+            if attempt == STORE_RETRIES:
+                raise StoreUnavailable(f"GET {path} kept failing with {response.status_code}")
+        await asyncio.sleep(STORE_RETRY_BACKOFF * 2 ** attempt)
+
+
+def _query_value(value):
+    return str(value).lower() if isinstance(value, bool) else value
+
+# Yield the records of a list endpoint as they arrive, following pagination,
+# decoded into the given record type.
+# Filters are sent as query parameters; a store that ignores them sends every
+# record, so callers still check what they receive. Raises StoreUnavailable
+# when the listing cannot be read completely.
+
+
+async def iter_records(path, record=None, **filters):
+    params = {'limit': STORE_PAGE_SIZE}
+    params.update((name, _query_value(value)) for name, value in filters.items() if value is not None)
+    url = path
+    while url:
+        cursor = {}
+        async for data in _stream_records(url, params, cursor):
+            yield record.from_json(data) if record is not None else data
+        # Next links carry their own query string
+        url, params = cursor.get('next'), None
+
+# Stream requests, optionally only unanswered ones or those of one user
+
+
+def iter_requests(is_responded=None, user_id=None):
+    return iter_records('/requests/', Request, is_responded=is_responded, user_id=user_id)
+
+# Stream messages, optionally only those of one user or request
+
+
+def iter_messages(user_id=None, request_id=None):
+    return iter_records('/messages/', Message, user_id=user_id, request=request_id)
+
+# POST json to a path; writes are not idempotent, so they are never retried
+
+
+async def _post(path, data):
+    status_code, body = await post_json(path, data)
+    return body
+
+# POST json with an optional idempotency key and return (status_code, body);
+# status_code is None when the request never reached the store or its circuit is open
+
+
+async def post_json(path, data, idempotency_key=None):
+    health = endpoint_health('POST', path)
+    health.requests += 1
+    if not health.breaker.allow():
+        health.shed += 1
+        return None, None
+    headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+    sent, extensions = _request_timer()
+    start = time.perf_counter()
+    try:
+        response = await get_client().post(path, json=data, headers=headers, timeout=_timeout(health),
+                                           extensions=extensions)
+    except httpx.PoolTimeout:
+        health.pool_timeouts += 1
+        return None, None
+    except httpx.TransportError:
+        observe_upstream('POST', path, None, time.perf_counter() - sent.get('at', start))
+        health.breaker.record_failure()
+        return None, None
+    elapsed = time.perf_counter() - sent.get('at', start)
+    observe_upstream('POST', path, response.status_code, elapsed)
+    health.latencies.observe(elapsed)
+    if response.status_code >= 500:
+        health.breaker.record_failure()
+    else:
+        health.breaker.record_success()
+    if response.status_code != 201:
+        return response.status_code, None
+    try:
+        return response.status_code, loads(response.content)
+    except ValueError:
+        # Stored, but the body is not JSON; the caller must not post it again
+        return response.status_code, None
 
 # Fetch all categories
 
 
-def get_categories():
-    response = requests.get(f'{BASE_URL}/categories/')
-    return response.json() if response.status_code == 200 else []
+@cached('categories', Category)
+async def get_categories():
+    return await _get('/categories/', [], record=Category)
 
 # Fetch subcategories for a specific category
 
 
-def get_subcategories(category_id):
-    response = requests.get(
-        f'{BASE_URL}/categories/{category_id}/subcategories/')
-    return response.json() if response.status_code == 200 else []
+@cached('subcategories', Subcategory)
+async def get_subcategories(category_id):
+    return await _get(f'/categories/{category_id}/subcategories/', [], record=Subcategory)
 
 # Fetch brands for a specific subcategory
 
 
-def get_brands(subcategory_id):
-    response = requests.get(
-        f'{BASE_URL}/subcategories/{subcategory_id}/brands/')
-    return response.json() if response.status_code == 200 else []
+@cached('brands', Brand)
+async def get_brands(subcategory_id):
+    return await _get(f'/subcategories/{subcategory_id}/brands/', [], record=Brand)
 
 # Fetch models for a specific brand
 
 
-def get_models(brand_id):
-    response = requests.get(f'{BASE_URL}/brands/{brand_id}/models/')
-    return response.json() if response.status_code == 200 else []
+@cached('models', Model)
+async def get_models(brand_id):
+    return await _get(f'/brands/{brand_id}/models/', [], record=Model)
 
 # Fetch items for a specific model
 
 
-def get_products(model_id):
-    response = requests.get(f'{BASE_URL}/models/{model_id}/items/')
-    return response.json() if response.status_code == 200 else []
+@cached('items', Item)
+async def get_products(model_id):
+    return await _get(f'/models/{model_id}/items/', [], hedge=True, record=Item)
 
 # Fetch details of a specific item/product
 
 
-def get_product_details(product_id):
-    response = requests.get(f'{BASE_URL}/items/{product_id}/')
-    return response.json() if response.status_code == 200 else None
+@cached('item', Item)
+async def get_product_details(product_id):
+    return await _get(f'/items/{product_id}/', None, hedge=True, record=Item)
 
-# Check stock availability for a specific item
+# Check stock availability for a specific item; stock changes often, so it
+# gets a short TTL and is never served from the on-disk snapshot
 
 
-def check_stock_availability(item_id):
-    response = requests.get(f'{BASE_URL}/items/{item_id}/stocks/')
-    return response.json() if response.status_code == 200 else None
+@cached('stock', Stock, persist=False)
+async def check_stock_availability(item_id):
+    return await _get(f'/items/{item_id}/stocks/', None, record=Stock)
 
-# Search for items by query
+# Search for items by query; reading stops once limit items have arrived
 
 
-def search_items(query):
-    response = requests.get(f'{BASE_URL}/items/search?q={query}')
-    return response.json() if response.status_code == 200 else []
+async def search_items(query, limit=SEARCH_MAX_RESULTS):
+    items = []
+    try:
+        async with aclosing(iter_records('/items/search', Item, q=query)) as records:
+            async for item in records:
+                items.append(item)
+                if len(items) >= limit:
+                    break
+    except StoreUnavailable:
+        # Whatever arrived before the failure is still worth showing
+        pass
+    return items
 
 # Fetch all details of a specific brand by ID
 
 
-def get_brand_details(brand_id):
-    response = requests.get(f'{BASE_URL}/brands/{brand_id}/')
-    return response.json() if response.status_code == 200 else None
+@cached('brand', Brand)
+async def get_brand_details(brand_id):
+    return await _get(f'/brands/{brand_id}/', None, record=Brand)
 
 # Fetch all details of a specific model by ID
 
 
-def get_model_details(model_id):
-    response = requests.get(f'{BASE_URL}/models/{model_id}/')
-    return response.json() if response.status_code == 200 else None
+@cached('model', Model)
+async def get_model_details(model_id):
+    return await _get(f'/models/{model_id}/', None, record=Model)
 
 # Fetch all details of a specific subcategory by ID
 
 
-def get_subcategory_details(subcategory_id):
-    response = requests.get(f'{BASE_URL}/subcategories/{subcategory_id}/')
-    return response.json() if response.status_code == 200 else None
+@cached('subcategory', Subcategory)
+async def get_subcategory_details(subcategory_id):
+    return await _get(f'/subcategories/{subcategory_id}/', None, record=Subcategory)
 
 # Fetch details of a specific item/product directly from the new endpoint
 
 
-def fetch_item_details(item_id):
-    response = requests.get(f'{BASE_URL}/items/{item_id}/')
-    return response.json() if response.status_code == 200 else None
+@cached('item', Item)
+async def fetch_item_details(item_id):
+    return await _get(f'/items/{item_id}/', None, hedge=True, record=Item)
 
-# Add a new request
+# Detail fetches still running after their caller's budget expired; they keep
+# going so the item cache is warm for the next query
+_background_fetches = set()
+
+# Fetch details for many items concurrently, bounded by a latency budget
+
+
+async def fetch_items_details(item_ids, budget=INLINE_LATENCY_BUDGET):
+    """Return {item_id: details} for the items resolved within the budget."""
+    semaphore = asyncio.Semaphore(INLINE_DETAIL_CONCURRENCY)
+
+    async def fetch(item_id):
+        async with semaphore:
+            return item_id, await fetch_item_details(item_id)
+
+    # Duplicate ids share a single fetch; cached ids resolve without a request
+    tasks = [asyncio.create_task(fetch(item_id)) for item_id in dict.fromkeys(item_ids)]
+    if not tasks:
+        return {}
+    done, pending = await asyncio.wait(tasks, timeout=budget)
+    for task in pending:
+        _background_fetches.add(task)
+        task.add_done_callback(_background_fetches.discard)
+
+    details = {}
+    for task in done:
+        if task.exception() is None:
+            item_id, item_details = task.result()
+            if item_details:
+                details[item_id] = item_details
+    return details
+
+# Build the payload for a new request
 
 
-def create_request(user_id, username, name, phone, address, additional_text):
-    data = {
+def request_payload(user_id, username, name, phone, address, additional_text):
+    return {
         "user_id": user_id,
         "username": username,
         "name": name,
@@ -100,33 +463,38 @@ def create_request(user_id, username, name, phone, address, additional_text):
         "address": address,
         "additional_text": additional_text
     }
-    response = requests.post(f'{BASE_URL}/requests/', json=data)
-    return response.json() if response.status_code == 201 else None
 
-# Add a new message
+# Build the payload for a new message
 
 
-def create_message(request_id, sender_id, user_id, content):
-    data = {
+def message_payload(request_id, sender_id, user_id, content):
+    return {
         "request": request_id,
         "sender_id": sender_id,
         "user_id": user_id,
         "content": content
     }
-    response = requests.post(f'{BASE_URL}/messages/', json=data)
-    return response.json() if response.status_code == 201 else None
+
+# Add a new request
+
+
+async def create_request(user_id, username, name, phone, address, additional_text):
+    return await _post('/requests/', request_payload(user_id, username, name, phone, address, additional_text))
+
+# Add a new message
+
+
+async def create_message(request_id, sender_id, user_id, content):
+    return await _post('/messages/', message_payload(request_id, sender_id, user_id, content))
 
 # Get all requests
-def get_all_requests():
-    response = requests.get(f'{BASE_URL}/requests/')
-    return response.json() if response.status_code == 200 else []
+async def get_all_requests():
+    return await _get('/requests/', [], record=Request)
 
 # get request by ID
-def get_request_details(request_id):
-    response = requests.get(f'{BASE_URL}/requests/{request_id}/')
-    return response.json() if response.status_code == 200 else None
+async def get_request_details(request_id):
+    return await _get(f'/requests/{request_id}/', None, record=Request)
 
 # get all messages
-def get_all_messages():
-    response = requests.get(f'{BASE_URL}/messages/')
-    return response.json() if response.status_code == 200 else []
+async def get_all_messages():
+    return await _get('/messages/', [], record=Message)
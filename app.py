@@ -1,18 +1,41 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, InlineQueryResultArticle, InputTextMessageContent
-from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes, InlineQueryHandler, MessageHandler, filters, ConversationHandler
-from api import (get_categories, get_subcategories, get_brands, get_models, get_products, get_product_details, check_stock_availability, search_items, fetch_item_details, create_request,
-create_message, get_all_requests, get_request_details, get_all_messages)
+from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes, InlineQueryHandler, MessageHandler, filters, ConversationHandler, TypeHandler
+from api import (get_categories, get_subcategories, get_brands, get_models, get_products, get_product_details, check_stock_availability, search_items, fetch_items_details,
+get_request_details, close_client)
+from search_index import catalog_index, search_cache, refresh_index_forever
+from catalog import warm_up, prefetch, refresh_catalog_forever
+from pending import pending_requests, reconcile_forever
+from routing import routing_table
+from cache import catalog_cache, MISSING
+from snapshot import catalog_snapshot, flush_forever, reload_forever
+from webhook import run_webhook
+from scheduler import ChatOrderedUpdateProcessor
+from persistence import BackendPersistence, get_backend, close_backend
+from dispatcher import dispatcher
+from outbox import outbox, queue_request, queue_message
+from keyboards import level_keyboard, item_keyboard, back_button, keyboard_cache
+from callbacks import decode, NAV, MAKE_REQUEST, NOOP, WATCH, UNWATCH
+from models import Item, to_json
+from templates import (product_card, PRODUCT_CARD, PRODUCT_INFO, PRODUCT_UNAVAILABLE, NEW_REQUEST, NEW_LIVE_AGENT_REQUEST, PENDING_HEADER,
+PENDING_ENTRY, product_card_cache)
+from stock_watch import stock_watcher
+from concurrency import Debouncer, single_flight
+from metrics import registry, measure_handler, inline_latency, trace, serve_metrics
+from breaker import health_stats
+from config import (SEARCH_INDEX_ENABLED, SEARCH_CACHE_TTL, INLINE_DEBOUNCE_DELAY, INLINE_CACHE_TIME, INLINE_IS_PERSONAL,
+PENDING_PAGE_SIZE, PENDING_TEXT_PREVIEW, CATALOG_WARMUP, CATALOG_WARMUP_TIMEOUT, BOT_MODE, UPDATE_WORKERS, ADMINS,
+STOCK_WATCH_ENABLED, SNAPSHOT_RELOAD_INTERVAL, CONVERSATION_TIMEOUT)
 from uuid import uuid4
 from dotenv import load_dotenv
 from telegram.constants import ChatAction
+import asyncio
 import os
-import re
+import time
 from datetime import datetime
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
-ADMINS = [1648265210] 
 # Conversation states
 REQUEST, PHONE, ADDRESS = range(3)
 # conversation states for live_agent
@@ -21,56 +44,67 @@ LIVE_REQUEST, LIVE_PHONE, LIVE_ADDRESS, LIVE_ADDITIONAL_TEXT = range(3, 7)
 # Conversation states for the 'respond' command
 RESPOND_TO_REQUEST, RESPONSE_MESSAGE = range(2)
 
+# Render one page of pending requests with prev/next buttons
+def render_requests_page(number):
+    requests, number, pages = pending_requests.page(number, PENDING_PAGE_SIZE)
+    if not requests:
+        return "No pending requests found.", None, None
+
+    message = PENDING_HEADER.render(page=number + 1, pages=pages)
+    for req in requests:
+        additional_text = req.additional_text or ''
+        if len(additional_text) > PENDING_TEXT_PREVIEW:
+            additional_text = additional_text[:PENDING_TEXT_PREVIEW] + '…'
+        message += PENDING_ENTRY.render(id=req.id, user_id=req.user_id, additional_text=additional_text)
+
+    buttons = []
+    if number > 0:
+        buttons.append(InlineKeyboardButton("◀️ Prev", callback_data=f"requests_page_{number - 1}"))
+    if number < pages - 1:
+        buttons.append(InlineKeyboardButton("Next ▶️", callback_data=f"requests_page_{number + 1}"))
+    reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+    return message, reply_markup, PENDING_ENTRY.parse_mode
+
 # Command handler to fetch all requests for admin
+@measure_handler
 async def list_requests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """List all user requests for the admin that have not been responded to."""
-    admin_id = 1648265210  # Replace with your admin ID
-    
-    if update.message.from_user.id != admin_id:
+    """List the first page of user requests that have not been responded to."""
+    if update.message.from_user.id not in ADMINS:
         await update.message.reply_text("You do not have permission to access this command.")
         return
     
     try:
         await update.message.chat.send_action(ChatAction.TYPING)
-        requests = get_all_requests()  # Make sure this function exists and works correctly
-        
-        # Filter requests where is_responded is False
-        pending_requests = [req for req in requests if not req['is_responded']]
-
-        if pending_requests:
-            message = "📨 *Unresponded Requests*\n\n"
-            for req in pending_requests:
-                # Escape special characters in the text to comply with MarkdownV2
-                request_id = str(req['id']).replace('.', '\\.').replace('-', '\\-').replace('_', '\\_')
-                user_id = str(req['user_id']).replace('-', '\\-')
-                additional_text = req['additional_text'].replace('.', '\\.').replace('-', '\\-').replace('_', '\\_')
-
-                message += (
-                    f"❓ *Request ID:* {request_id}\n"
-                    f"👤 *User ID:* {user_id}\n"
-                    f"📄 *Additional Text:* {additional_text}\n\n"
-                )
-            
-            # Split the message into multiple parts if it exceeds Telegram's character limit (4096 characters)
-            if len(message) > 4096:
-                for i in range(0, len(message), 4096):
-                    await update.message.reply_text(message[i:i+4096], parse_mode='MarkdownV2')
-            else:
-                await update.message.reply_text(message, parse_mode='MarkdownV2')
-        else:
-            await update.message.reply_text("No pending requests found.")
+        # The local index is only loaded from the API until the first reconcile has run
+        if not pending_requests.ready:
+            await pending_requests.reconcile()
+
+        message, reply_markup, parse_mode = render_requests_page(0)
+        await update.message.reply_text(message, reply_markup=reply_markup, parse_mode=parse_mode)
     
     except Exception as e:
         # Log the error and notify the admin
         await update.message.reply_text(f"An error occurred: {e}")
 
+# Callback handler for the prev/next buttons of /requests
+@measure_handler
+async def requests_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show another page of pending requests."""
+    query = update.callback_query
+    if query.from_user.id not in ADMINS:
+        await query.answer("You do not have permission to access this command.")
+        return
+
+    await query.answer()
+    message, reply_markup, parse_mode = render_requests_page(int(query.data.split('_')[2]))
+    await query.edit_message_text(message, reply_markup=reply_markup, parse_mode=parse_mode)
+
 
 # Command handler to start the respond process
+@measure_handler
 async def respond(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start the process to respond to a request."""
-    admin_id = 1648265210  
-
-    if update.message.from_user.id != admin_id:
+    if update.message.from_user.id not in ADMINS:
         await update.message.reply_text("You do not have permission to access this command.")
         return ConversationHandler.END
 
@@ -78,24 +112,26 @@ async def respond(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return RESPOND_TO_REQUEST
 
 # Handle the request ID input for responding
+@measure_handler
 async def respond_request_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle the request ID input and fetch user details."""
     request_id = update.message.text
     context.user_data['request_id'] = request_id
 
     # Fetch the request details using the request_id from the API
-    request_details = get_request_details(request_id)
+    request_details = await get_request_details(request_id)
 
     if request_details:
-        user_id = request_details['user_id']
+        user_id = request_details.user_id
         context.user_data['user_id'] = user_id
-        await update.message.reply_text(f"Request found for user {request_details['name']} (User ID: {user_id}).\nPlease enter your response message:")
+        await update.message.reply_text(f"Request found for user {request_details.name} (User ID: {user_id}).\nPlease enter your response message:")
         return RESPONSE_MESSAGE
     else:
         await update.message.reply_text("Invalid Request ID. Please try again.")
         return ConversationHandler.END
 
 # Handle the response message input and send the message to the user
+@measure_handler
 async def send_response(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle the response message and send it to the user."""
     response_message = update.message.text
@@ -104,14 +140,17 @@ async def send_response(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     admin_id = update.message.from_user.id 
 
    
-    message_sent = create_message(request_id=request_id, sender_id=admin_id, user_id=user_id, content=response_message)
+    # Journaled locally and stored in the API in the background
+    await queue_message(request_id=request_id, sender_id=admin_id, user_id=user_id, content=response_message)
+    pending_requests.discard(request_id)
+    await routing_table.set(user_id, request_id, admin_id)
     
    
     await update.message.reply_text(f"Message sent successfully to user {user_id}.")
         
    
     try:
-        await context.bot.send_message(chat_id=user_id, text=response_message)
+        await dispatcher.send(user_id, response_message)
     except Exception as e:
         logging.error(f"Failed to send message to user {user_id}: {e}")
         await update.message.reply_text(f"Failed to send message to user {user_id} on Telegram. Error: {e}")
@@ -121,7 +160,15 @@ async def send_response(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
 
 
+# Leave the request or response flow the user is in
+@measure_handler
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Cancel the current conversation."""
+    await update.message.reply_text("Cancelled. Use /start to browse the catalog or /live_agent to contact us.")
+    return ConversationHandler.END
+
 # Command handler to start the live agent conversation
+@measure_handler
 async def live_agent(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Start the conversation to request a live agent."""
     await update.message.chat.send_action(ChatAction.TYPING)
@@ -129,6 +176,7 @@ async def live_agent(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return LIVE_REQUEST
 
 # Conversation handler for requesting name
+@measure_handler
 async def live_agent_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle name input for live agent request."""
     context.user_data['name'] = update.message.text
@@ -136,6 +184,7 @@ async def live_agent_name(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return LIVE_PHONE
 
 # Conversation handler for requesting phone number
+@measure_handler
 async def live_agent_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle phone input for live agent request."""
     context.user_data['phone'] = update.message.text
@@ -143,12 +192,14 @@ async def live_agent_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     return LIVE_ADDRESS
 
 # Conversation handler for requesting address
+@measure_handler
 async def live_agent_address(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle address input for live agent request."""
     context.user_data['address'] = update.message.text
     await update.message.reply_text("Any additional details you would like to provide?")
     return LIVE_ADDITIONAL_TEXT
 
+@measure_handler
 async def live_agent_complete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle final details and send the request to the admin."""
     context.user_data['additional_text'] = update.message.text
@@ -160,141 +211,156 @@ async def live_agent_complete(update: Update, context: ContextTypes.DEFAULT_TYPE
     additional_text = context.user_data.get('additional_text')
 
     
-    request = create_request(user_id=user_id, username=username, name=name, phone=phone, address=address, additional_text=additional_text)
+    try:
+        # Journaled locally and stored in the API in the background
+        await queue_request(user_id=user_id, username=username, name=name, phone=phone, address=address, additional_text=additional_text)
+    except Exception as e:
+        logging.error(f"Failed to queue request for user {user_id}: {e}")
+        await update.message.reply_text("There was an error submitting your request. Please try again later.")
+        return ConversationHandler.END
 
-    if request:
-        await update.message.reply_text("Your request has been submitted successfully. We will get back to you soon.")
-        
-        # Notify the admin
-        admin_id = 1648265210
-        request_details = (
-            f"📨 *New Live Agent Request*\n\n"
-            f"*Username:* {username}\n"
-            f"*Name:* {name}\n"
-            f"*Phone:* {phone}\n"
-            f"*Address:* {address}\n\n"
-            f"📄 *Additional Information:* {additional_text}"
-        )
-        await context.bot.send_message(chat_id=admin_id, text=request_details, parse_mode='MarkdownV2')
+    await update.message.reply_text("Your request has been submitted successfully. We will get back to you soon.")
+
+    # Notify the admin
+    request_details = NEW_LIVE_AGENT_REQUEST.render(username=username, name=name, phone=phone, address=address,
+                                                    additional_text=additional_text)
+    # Queued for the admins; the user does not wait for the notification to go out
+    dispatcher.notify_admins(request_details, parse_mode=NEW_LIVE_AGENT_REQUEST.parse_mode)
 
-    else:
-        await update.message.reply_text("There was an error submitting your request. Please try again later.")
-    
     return ConversationHandler.END
 
 
+# Catalog screens by depth of the breadcrumb path: the getter listing the
+# children, the prompt, the text for an empty level and the getter for the
+# level the user is likely to open next
+LEVELS = (
+    (get_categories, "Please choose a category:", "No categories available.", get_subcategories),
+    (get_subcategories, "Please choose a subcategory:", "No subcategories available.", get_brands),
+    (get_brands, "Please choose a brand:", "No brands available.", get_models),
+    (get_models, "Please choose a model:", "No models available.", get_products),
+    (get_products, "Please choose an item:", "No items available.", get_product_details),
+)
+
+
 # Command handler to show categories
+@measure_handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Start command to show categories."""
     await update.message.chat.send_action(ChatAction.TYPING)
-    categories = get_categories()
+    categories = await get_categories()
     if categories:
-        keyboard = [
-            [InlineKeyboardButton(cat['name'], callback_data=f"category_{cat['id']}")] for cat in categories
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = level_keyboard((), categories)
         await update.message.reply_text("Please choose a category:", reply_markup=reply_markup)
+        # Load the level the user is likely to open next in the background
+        prefetch(get_subcategories, [cat.id for cat in categories])
     else:
         await update.message.reply_text("No categories available.")
 
+# Show the catalog screen at path, or the product card once the path reaches an item
+
+
+async def show_path(query, context, path, page):
+    if len(path) >= len(LEVELS):
+        return await show_item(query, context, path)
+    getter, prompt, empty_text, next_getter = LEVELS[len(path)]
+    entries = await getter(*path[-1:])
+    if entries:
+        await query.edit_message_text(prompt, reply_markup=level_keyboard(path, entries, page))
+        prefetch(next_getter, [entry.id for entry in entries])
+    else:
+        # Still let the user step back out of an empty level
+        reply_markup = InlineKeyboardMarkup([[back_button(path)]]) if path else None
+        await query.edit_message_text(empty_text, reply_markup=reply_markup)
+
+# Show the product card for the item at the end of path
+
+
+async def show_item(query, context, path):
+    item_id = path[-1]
+    # Look up the product and its stock availability concurrently
+    product_details, stock_details = await asyncio.gather(get_product_details(item_id), check_stock_availability(item_id))
+    if product_details:
+        # Remember the product so the order flow does not fetch it again
+        context.user_data['product'] = to_json(product_details)
+        available = bool(stock_details and stock_details.is_available)
+        # The "Notify me" state only shows on out-of-stock items
+        watching = not available and await stock_watcher.is_watching(item_id, query.from_user.id)
+        reply_markup = item_keyboard(path, available, watching)
+        await query.edit_message_text(product_card(product_details, available), reply_markup=reply_markup,
+                                      parse_mode=PRODUCT_CARD.parse_mode)
+    else:
+        await query.edit_message_text("No product details available.")
+
+# Start the request flow for the item at the end of path
+
+
+async def make_request(query, context, path, page):
+    # Save the item_id to context for further use
+    context.user_data['item_id'] = path[-1]
+    await query.edit_message_text("Please provide your name:")
+    return REQUEST
+
+
+async def ignore_button(query, context, path, page):
+    return None
+
+# Notify the user once the item at the end of path is back in stock
+
+
+async def watch_item(query, context, path, page):
+    product_details = await get_product_details(path[-1])
+    name = product_details.name if product_details else f"Item {path[-1]}"
+    await stock_watcher.subscribe(path, query.from_user.id, name)
+    await query.edit_message_reply_markup(item_keyboard(path, available=False, watching=True))
+
+
+async def unwatch_item(query, context, path, page):
+    await stock_watcher.unsubscribe(path[-1], query.from_user.id)
+    await query.edit_message_reply_markup(item_keyboard(path, available=False))
+
+
+# Callback actions decoded from the button data
+CALLBACK_ACTIONS = {
+    NAV: show_path,
+    MAKE_REQUEST: make_request,
+    NOOP: ignore_button,
+    WATCH: watch_item,
+    UNWATCH: unwatch_item,
+}
+
+
 # Button handler for category, subcategory, brand, model navigation
+@measure_handler
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle button clicks to build hierarchical inline keyboards."""
     query = update.callback_query
     await query.answer()
 
-    data = query.data
-
-    if data.startswith('category_'):
-        category_id = data.split('_')[1]
-        subcategories = get_subcategories(category_id)
-        if subcategories:
-            keyboard = [
-                [InlineKeyboardButton(sub['name'], callback_data=f"subcategory_{sub['id']}")] for sub in subcategories
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text("Please choose a subcategory:", reply_markup=reply_markup)
-        else:
-            await query.edit_message_text("No subcategories available.")
-
-    elif data.startswith('subcategory_'):
-        subcategory_id = data.split('_')[1]
-        brands = get_brands(subcategory_id)
-        if brands:
-            keyboard = [
-                [InlineKeyboardButton(brand['name'], callback_data=f"brand_{brand['id']}")] for brand in brands
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text("Please choose a brand:", reply_markup=reply_markup)
-        else:
-            await query.edit_message_text("No brands available.")
-
-    elif data.startswith('brand_'):
-        brand_id = data.split('_')[1]
-        models = get_models(brand_id)
-        if models:
-            keyboard = [
-                [InlineKeyboardButton(model['name'], callback_data=f"model_{model['id']}")] for model in models
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text("Please choose a model:", reply_markup=reply_markup)
-        else:
-            await query.edit_message_text("No models available.")
-
-    elif data.startswith('model_'):
-        model_id = data.split('_')[1]
-        items = get_products(model_id)
-        if items:
-            keyboard = [
-                [InlineKeyboardButton(item['name'], callback_data=f"item_{item['id']}")] for item in items
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text("Please choose an item:", reply_markup=reply_markup)
-        else:
-            await query.edit_message_text("No items available.")
-
-    elif data.startswith('item_'):
-        item_id = data.split('_')[1]
-        product_details = get_product_details(item_id)
-        if product_details:
-            # Check stock availability and include it in the product details
-            stock_details = check_stock_availability(item_id)
-            is_available = "Yes" if stock_details and stock_details['is_available'] else "No"
-            formatted_details = re.escape(
-                f"📱 *{product_details['name']}*\n\n"
-                f"*Brand:* {product_details['brand']}\n"
-                f"*Model:* {product_details['model']}\n"
-                f"*Subcategory:* {product_details['subcategory']}\n"
-                f"*Stock Available:* {is_available}\n"
-            )
-            # Add a button for making a request
-            keyboard = [
-                [InlineKeyboardButton("Make Request", callback_data=f"make_request_{item_id}")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(formatted_details, reply_markup=reply_markup, parse_mode='MarkdownV2')
-        else:
-            await query.edit_message_text("No product details available.")
-
-    elif data.startswith('make_request_'):
-        # Save the item_id to context for further use
-        context.user_data['item_id'] = data.split('_')[2]
-        await query.edit_message_text("Please provide your name:")
-        return REQUEST
+    try:
+        action, path, page = decode(query.data)
+        handler = CALLBACK_ACTIONS[action]
+    except (ValueError, KeyError):
+        # Buttons sent before a change of the callback format
+        await query.edit_message_text("This menu has expired. Please use /start to browse the catalog again.")
+        return None
+    return await handler(query, context, path, page)
 
 # Conversation handler for request flow
+@measure_handler
 async def request_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle name input."""
     context.user_data['name'] = update.message.text
     await update.message.reply_text("Please provide your phone number:")
     return PHONE
 
+@measure_handler
 async def request_phone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle phone number input."""
     context.user_data['phone'] = update.message.text
     await update.message.reply_text("Please provide your address:")
     return ADDRESS
 
+@measure_handler
 async def request_address(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle address input and send the request to the admin."""
     context.user_data['address'] = update.message.text
@@ -303,16 +369,16 @@ async def request_address(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     phone = context.user_data.get('phone')
     address = context.user_data.get('address')
 
-    # Fetch product details
-    product_details = get_product_details(item_id)
+    # Reuse the product shown on the item screen, fetching it only if the conversation lost it
+    product = context.user_data.get('product')
+    product_details = Item.from_json(product) if product else None
+    if not product_details or str(product_details.id) != str(item_id):
+        product_details = await get_product_details(item_id)
     if product_details:
-        product_info = (
-            f"*Product Name:* {product_details['name']}\n"
-            f"*Brand:* {product_details['brand']}\n"
-            f"*Model:* {product_details['model']}\n"
-        )
+        product_info = PRODUCT_INFO.render(name=product_details.name, brand=product_details.brand,
+                                           model=product_details.model)
     else:
-        product_info = "Product details not available."
+        product_info = PRODUCT_UNAVAILABLE.render()
 
     
     current_date = datetime.now().strftime('%A, %b %d, %Y')
@@ -321,69 +387,113 @@ async def request_address(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     username = update.message.from_user.username or "No username"
 
     
-    request_details = (
-        f"📨 *New Request*\n\n"
-        f"*Date:* {current_date}\n"
-        f"*Username:* {username}\n"
-        f"*Name:* {name}\n"
-        f"*Phone:* {phone}\n"
-        f"*Address:* {address}\n\n"
-        f"🛍️ *Product Information*\n"
-        f"{product_info}"
-    )
+    request_details = NEW_REQUEST.render(date=current_date, username=username, name=name, phone=phone,
+                                         address=address) + product_info
 
     
-    admin_id = 1648265210
-    await context.bot.send_message(chat_id=admin_id, text=request_details, parse_mode='MarkdownV2')
+    dispatcher.notify_admins(request_details, parse_mode=NEW_REQUEST.parse_mode)
 
     
     await update.message.reply_text("Your request has been sent to the admin. We will get back to you soon.")
     
     return ConversationHandler.END
 
+# Resolve a normalized query to (item, details) pairs; details is None when unavailable.
+# Identical queries from different users in flight at once share one lookup.
+@single_flight
+async def lookup_items(query):
+    matches = search_cache.get(query)
+    if matches is not MISSING:
+        return matches
+
+    # Answer from the local index; the upstream search is only a fallback
+    results = catalog_index.search(query) if catalog_index.ready else []
+    if results:
+        matches = [(item, item if item.has_details else None) for item in results]
+    else:
+        results = await search_items(query)
+        # Resolve details concurrently; items missing after the budget are shown degraded
+        details = await fetch_items_details([item.id for item in results])
+        matches = [(item, details.get(item.id)) for item in results]
+
+    # Degraded answers are not cached so the next query can complete them
+    if matches and all(item_details for _, item_details in matches):
+        search_cache.set(query, matches, SEARCH_CACHE_TTL)
+    return matches
+
 # Inline search handler
+@measure_handler
 async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle inline queries for searching items."""
-    query = update.inline_query.query
+    query = ' '.join(update.inline_query.query.lower().split())
     if not query:
         return
 
+    # Telegram sends a query per keystroke; only the user's latest one is answered
+    inline_debouncer.submit(update.inline_query.from_user.id, answer_inline_query, update.inline_query, query, time.perf_counter())
+
+async def answer_inline_query(inline_query, query, received_at):
+    """Look up a debounced inline query and answer it."""
+    outcome = 'answered'
     try:
-        results = search_items(query)
+        matches = await lookup_items(query)
         articles = []
-        for item in results:
-            item_details = fetch_item_details(item['id'])
+        for item, item_details in matches:
             if item_details:
                 articles.append(
                     InlineQueryResultArticle(
                         id=str(uuid4()),
-                        title=item_details['name'],
+                        title=item_details.name,
                         input_message_content=InputTextMessageContent(
-                            f"Product details for {item_details['name']}:\n"
-                            f"Brand: {item_details['brand']}\n"
-                            f"Model: {item_details['model']}\n"
-                            f"Subcategory: {item_details['subcategory']}\n"
+                            f"Product details for {item_details.name}:\n"
+                            f"Brand: {item_details.brand}\n"
+                            f"Model: {item_details.model}\n"
+                            f"Subcategory: {item_details.subcategory}\n"
                         ),
-                        description=f"Brand: {item_details['brand']}, Model: {item_details['model']}, Subcategory: {item_details['subcategory']}"
+                        description=f"Brand: {item_details.brand}, Model: {item_details.model}, Subcategory: {item_details.subcategory}"
                     )
                 )
             else:
                 articles.append(
                     InlineQueryResultArticle(
                         id=str(uuid4()),
-                        title=item['name'],
+                        title=item.name,
                         input_message_content=InputTextMessageContent(
-                            f"Details for {item['name']} could not be retrieved."
+                            f"Details for {item.name} could not be retrieved."
                         ),
                         description="Details unavailable."
                     )
                 )
-        await update.inline_query.answer(articles, cache_time=1)
+        await inline_query.answer(articles, cache_time=INLINE_CACHE_TIME, is_personal=INLINE_IS_PERSONAL)
 
+    except asyncio.CancelledError:
+        # A newer query from the same user replaced this one
+        outcome = 'superseded'
+        raise
     except Exception as e:
-        await update.inline_query.answer([], switch_pm_text="An error occurred, please try again.", switch_pm_parameter="error")
+        outcome = 'error'
+        await inline_query.answer([], switch_pm_text="An error occurred, please try again.", switch_pm_parameter="error")
+    finally:
+        record_inline_query(query, outcome, received_at)
+
+
+def record_inline_query(query, outcome, received_at):
+    duration = time.perf_counter() - received_at
+    inline_latency.observe(duration, outcome=outcome)
+    trace('inline_query', query=query, outcome=outcome, duration=round(duration, 6))
+
+
+def inline_query_superseded(inline_query, query, received_at):
+    """Record a query replaced while it was still waiting out the debounce delay."""
+    record_inline_query(query, 'superseded', received_at)
+
+
+# Per-user debouncing of inline queries
+inline_debouncer = Debouncer(INLINE_DEBOUNCE_DELAY, on_superseded=inline_query_superseded)
+
 
 # Handler to process user messages and forward if needed
+@measure_handler
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle incoming messages from users."""
     user_id = update.message.from_user.id
@@ -394,44 +504,132 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
    
-    messages = get_all_messages()
-    print(messages) 
+    route = await routing_table.lookup(user_id)
 
-    
-    open_message = None
-    for msg in messages:
-        if int(msg['user_id']) == user_id:
-            open_message = msg
-            break
-
-    
-    if open_message:
-        request_id = open_message['request']
-        sender_id = open_message['sender_id']
+    if route:
+        request_id, sender_id = route
 
         
-        create_message(request_id=request_id, sender_id=sender_id, user_id=user_id, content=user_message)
+        await queue_message(request_id=request_id, sender_id=sender_id, user_id=user_id, content=user_message)
 
         
-        await context.bot.send_message(
-            chat_id=sender_id,
-            text=f"Message from user {user_id} (Request ID: {request_id}):\n\n{user_message}"
-        )
+        dispatcher.notify(sender_id, f"Message from user {user_id} (Request ID: {request_id}):\n\n{user_message}")
         await update.message.reply_text("Your message has been forwarded to the appropriate sender.")
     else:
         await update.message.reply_text("No open messages found for you. Use /live_agent command to make a new request.")
 
 
-if __name__ == '__main__':
-    load_dotenv()
-
-    app = ApplicationBuilder().token(os.getenv('TOKEN')).build()
+# Long-running background jobs started with the bot
+background_tasks = []
+
+# Prometheus endpoint, started in post_init
+metrics_server = None
+
+
+# Start background jobs once the application is initialized
+async def post_init(application) -> None:
+    global metrics_server
+    # Cache hit rates and queue depths are read from each component's stats() when scraped
+    registry.register_stats('catalog_cache', catalog_cache.stats)
+    registry.register_stats('search_cache', search_cache.stats)
+    registry.register_stats('keyboard_cache', keyboard_cache.stats)
+    registry.register_stats('product_card_cache', product_card_cache.stats)
+    registry.register_stats('snapshot', catalog_snapshot.stats)
+    registry.register_stats('dispatcher', dispatcher.stats)
+    registry.register_stats('outbox', outbox.stats)
+    registry.register_stats('updates', application.update_processor.stats)
+    registry.register_stats('inline', lambda: {'superseded': inline_debouncer.superseded})
+    registry.register_stats('store', health_stats)
+    registry.register_stats('stock_watch', stock_watcher.stats)
+    metrics_server = await serve_metrics()
+
+    # The snapshot answers navigation right away, even when the store is down
+    dispatcher.start(application.bot)
+    await catalog_snapshot.load()
+    background_tasks.append(asyncio.create_task(flush_forever()))
+    if SNAPSHOT_RELOAD_INTERVAL:
+        background_tasks.append(asyncio.create_task(reload_forever()))
+    if CATALOG_WARMUP:
+        await warm_up(CATALOG_WARMUP_TIMEOUT)
+    background_tasks.append(asyncio.create_task(refresh_catalog_forever()))
+    if SEARCH_INDEX_ENABLED:
+        background_tasks.append(asyncio.create_task(refresh_index_forever()))
+    background_tasks.append(asyncio.create_task(reconcile_forever()))
+    background_tasks.append(asyncio.create_task(outbox.run_forever()))
+    if STOCK_WATCH_ENABLED:
+        background_tasks.append(asyncio.create_task(stock_watcher.run_forever()))
+
+
+# Let queued outbound messages go out while the bot can still send them
+async def post_stop(application) -> None:
+    await dispatcher.stop()
+
+
+# Stop background jobs and release the shared store API connection pool when the bot stops
+async def post_shutdown(application) -> None:
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+    await close_client()
+    await close_backend()
+
+
+# Re-read this update's conversation states before any handler looks at them,
+# since another worker may have moved the conversation on; user_data and
+# chat_data are refreshed by PTB itself when the context is built
+
+
+async def load_shared_state(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_chat is None or update.effective_user is None:
+        return
+    # Every conversation here is per chat and per user
+    key = (update.effective_chat.id, update.effective_user.id)
+    # PTB exposes the tracked conversation states only on this attribute
+    conversations = context.application._conversation_handler_conversations
+    await context.application.persistence.refresh_conversations(conversations, key)
+    # Flows abandoned for longer than the timeout end here, also across restarts;
+    # the ends are written back with the rest of the update's changes
+    now = time.time()
+    if now - context.user_data.get('conversation_at', now) > CONVERSATION_TIMEOUT:
+        for states in conversations.values():
+            states.pop(key, None)
+    context.user_data['conversation_at'] = now
+
+# Write the update's changes back at once, so the chat's next update sees them
+# on whichever worker it lands
+
+
+async def save_shared_state(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await context.application.update_persistence()
+
+
+# Build the bot from an ApplicationBuilder that already has its token and
+# transport settings, so the same handlers run in production and in bench.py
+
+
+def build_application(builder):
+    builder = builder.post_init(post_init).post_stop(post_stop).post_shutdown(post_shutdown)
+    # Conversations, user_data and the shared components' state are kept in the persistence backend
+    backend = get_backend()
+    for component in (catalog_snapshot, routing_table, outbox, stock_watcher):
+        component.backend = backend
+    builder = builder.persistence(BackendPersistence(backend))
+    # Chats are processed concurrently, each chat's updates strictly in order
+    builder = builder.concurrent_updates(ChatOrderedUpdateProcessor(UPDATE_WORKERS))
+    app = builder.build()
+    app.add_handler(TypeHandler(Update, load_shared_state), group=-1)
+    app.add_handler(TypeHandler(Update, save_shared_state), group=1)
 
-   
     app.add_handler(CommandHandler("start", start))
 
     # Define the conversation handler for live agent request
     live_agent_conv_handler = ConversationHandler(
+        name="live_agent",
+        persistent=True,
         entry_points=[CommandHandler("live_agent", live_agent)],
         states={
             LIVE_REQUEST: [MessageHandler(filters.TEXT & ~filters.COMMAND, live_agent_name)],
@@ -439,40 +637,63 @@ if __name__ == '__main__':
             LIVE_ADDRESS: [MessageHandler(filters.TEXT & ~filters.COMMAND, live_agent_address)],
             LIVE_ADDITIONAL_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, live_agent_complete)],
         },
-        fallbacks=[],
+        fallbacks=[CommandHandler("cancel", cancel)],
     )
     app.add_handler(live_agent_conv_handler)
 
+    # Paging for /requests; registered before the product flow, whose entry point takes every callback
+    app.add_handler(CallbackQueryHandler(requests_page, pattern=r'^requests_page_\d+$'))
+
     # Define the conversation handler for product request flow
     product_request_conv_handler = ConversationHandler(
+        name="product_request",
+        persistent=True,
         entry_points=[CallbackQueryHandler(button_handler)],
         states={
             REQUEST: [MessageHandler(filters.TEXT & ~filters.COMMAND, request_name)],
             PHONE: [MessageHandler(filters.TEXT & ~filters.COMMAND, request_phone)],
             ADDRESS: [MessageHandler(filters.TEXT & ~filters.COMMAND, request_address)],
         },
-        fallbacks=[],
+        fallbacks=[CommandHandler("cancel", cancel)],
     )
     app.add_handler(product_request_conv_handler)
 
     # Conversation handler for responding to a user's request
     respond_conv_handler = ConversationHandler(
+        name="respond",
+        persistent=True,
         entry_points=[CommandHandler("respond", respond)],
         states={
             RESPOND_TO_REQUEST: [MessageHandler(filters.TEXT & ~filters.COMMAND, respond_request_id)],
             RESPONSE_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, send_response)],
         },
-        fallbacks=[],
+        fallbacks=[CommandHandler("cancel", cancel)],
     )
-    
+
     # Add the respond conversation handler
     app.add_handler(respond_conv_handler)
 
     # Add inline search handler
     app.add_handler(InlineQueryHandler(inline_search))
     app.add_handler(CommandHandler("requests", list_requests))
+    # /cancel outside of any flow
+    app.add_handler(CommandHandler("cancel", cancel))
 
     # Add text search handler, but after the conversation handlers to avoid conflicts
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return app
 
-    app.run_polling()
+
+if __name__ == '__main__':
+    load_dotenv()
+
+    builder = ApplicationBuilder().token(os.getenv('TOKEN'))
+    if BOT_MODE == 'webhook':
+        # Updates arrive through our own webhook server instead of long polling
+        builder = builder.updater(None)
+    app = build_application(builder)
+
+    if BOT_MODE == 'webhook':
+        asyncio.run(run_webhook(app))
+    else:
+        app.run_polling()
@@ -0,0 +1,198 @@
+"""Offline benchmark of the bot's hot paths against a fake store API and a fake Bot API, e.g.
+
+    python bench.py --updates 2000 --concurrency 50 --store-latency 0.03 --store-error-rate 0.01
+
+Updates go through the real Application (handlers, conversations, update
+processor and persistence) and are timed from dispatch until their handler
+returns; inline queries are timed until the bot answers them. The report
+lists p50/p99 latency per scenario, throughput and the store API calls made
+while under load.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from fake_store import FakeStore
+from fake_telegram import FakeBotRequest, message_update, callback_update, inline_update
+
+ADMIN_ID = 999
+SCENARIOS = ('start', 'browse', 'inline', 'message', 'requests')
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def parse_mix(text):
+    weights = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def make_updates(args, store, rng):
+    """Return (scenario, update dict) pairs drawn from the configured mix."""
+    from callbacks import encode, NAV
+
+    users = [1000 + i for i in range(args.users)]
+    routed_users = users[:max(1, len(users) // 4)]
+    # Breadcrumb paths of every catalog entry down to the items
+    paths = [()]
+    frontier = [((), None)]
+    for parent_level in (None, 'category', 'subcategory', 'brand', 'model'):
+        frontier = [(path + (entry['id'],), entry['id'])
+                    for path, parent_id in frontier for entry in store.children.get((parent_level, parent_id), [])]
+        paths.extend(path for path, _ in frontier)
+    words = sorted({word.lower() for item in store.items.values() for word in item['name'].split()})
+
+    names, weights = zip(*args.mix.items())
+    updates = []
+    for scenario in rng.choices(names, weights, k=args.updates):
+        if scenario == 'start':
+            update = message_update(rng.choice(users), '/start')
+        elif scenario == 'browse':
+            update = callback_update(rng.choice(users), encode(NAV, rng.choice(paths)))
+        elif scenario == 'inline':
+            query = ' '.join(rng.sample(words, rng.randint(1, 2)))
+            update = inline_update(rng.choice(users), query[:rng.randint(3, len(query))] if len(query) > 3 else query)
+        elif scenario == 'message':
+            update = message_update(rng.choice(routed_users), "Is it still available?")
+        else:
+            update = message_update(ADMIN_ID, '/requests')
+        updates.append((scenario, update))
+    return updates
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    users = [1000 + i for i in range(args.users)]
+    store = FakeStore(args.categories, args.fanout, args.store_latency, args.store_jitter, args.store_error_rate,
+                      requests=args.requests, route_users=users[:max(1, len(users) // 4)], admin_id=ADMIN_ID,
+                      seed=args.seed)
+    store_server = await store.start()
+    host, port = store_server.sockets[0].getsockname()[:2]
+
+    # The bot reads its settings at import time, so point it at the fakes first
+    os.environ.update({
+        'STORE_BASE_URL': f'http://{host}:{port}',
+        'ADMINS': str(ADMIN_ID),
+        'PERSISTENCE_BACKEND': 'memory',
+        'METRICS_PORT': '0',
+        'CATALOG_WARMUP': '1' if args.warmup else '0',
+        'SEARCH_INDEX_ENABLED': '1' if args.search_index else '0',
+        'OUTBOUND_GLOBAL_RATE': '1000000',
+        'OUTBOUND_PER_CHAT_INTERVAL': '0',
+    })
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+    import app as bot
+
+    request = FakeBotRequest(args.telegram_latency)
+    application = bot.build_application(
+        ApplicationBuilder().token('123456:BENCH').request(request).get_updates_request(request).updater(None))
+    updates = make_updates(args, store, rng)
+
+    started = time.perf_counter()
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    if args.settle:
+        # Let background crawls (search index, prefetch) finish before measuring
+        await asyncio.sleep(args.settle)
+    startup = time.perf_counter() - started
+    startup_calls = sum(store.calls.values())
+    store.reset_counts()
+    request.calls.clear()
+
+    latencies = {scenario: [] for scenario in SCENARIOS}
+    unanswered = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def dispatch(scenario, data):
+        nonlocal unanswered
+        async with semaphore:
+            update = Update.de_json(data, application.bot)
+            answered = request.expect_answer(update.inline_query.id) if scenario == 'inline' else None
+            start = loop.time()
+            await application.update_processor.process_update(update, application.process_update(update))
+            if answered is not None:
+                try:
+                    end = await asyncio.wait_for(answered, args.inline_timeout)
+                except asyncio.TimeoutError:
+                    # Superseded by a newer query from the same user, or too slow
+                    unanswered += 1
+                    return
+            else:
+                end = loop.time()
+            latencies[scenario].append(end - start)
+
+    load_started = time.perf_counter()
+    await asyncio.gather(*(dispatch(scenario, data) for scenario, data in updates))
+    elapsed = time.perf_counter() - load_started
+
+    await application.stop()
+    await application.post_stop(application)
+    await application.shutdown()
+    await application.post_shutdown(application)
+    store_server.close()
+    await store_server.wait_closed()
+
+    lines = [
+        f"Catalog: {len(store.items)} items, store latency {args.store_latency * 1000:.0f}±{args.store_jitter * 1000:.0f} ms, "
+        f"error rate {args.store_error_rate:.1%}",
+        f"Startup: {startup:.2f}s, {startup_calls} store calls",
+        f"Load: {len(updates)} updates in {elapsed:.2f}s ({len(updates) / elapsed:.0f}/s), concurrency {args.concurrency}",
+        "",
+        f"{'scenario':<10} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}",
+    ]
+    for scenario, values in latencies.items():
+        if values:
+            lines.append(f"{scenario:<10} {len(values):>7} {percentile(values, 50) * 1000:>9.1f} "
+                         f"{percentile(values, 99) * 1000:>9.1f} {max(values) * 1000:>9.1f}")
+    if unanswered:
+        lines.append(f"inline queries not answered within {args.inline_timeout}s (superseded or slow): {unanswered}")
+    lines += ["", f"Store API calls under load: {sum(store.calls.values())}"]
+    for endpoint, count in sorted(store.calls.items(), key=lambda pair: -pair[1]):
+        errors = store.errors.get(endpoint, 0)
+        lines.append(f"  {endpoint:<40} {count:>7}" + (f"  ({errors} errors)" if errors else ""))
+    lines += ["", f"Bot API calls under load: {sum(request.calls.values())}"]
+    for method, count in sorted(request.calls.items(), key=lambda pair: -pair[1]):
+        lines.append(f"  {method:<40} {count:>7}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the bot against a fake store API and a fake Bot API.")
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50, help="updates in flight at once")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('start=1,browse=5,inline=3,message=1,requests=0.2'),
+                        help="scenario weights, e.g. start=1,browse=5,inline=3,message=1,requests=0.2")
+    parser.add_argument('--categories', type=int, default=5)
+    parser.add_argument('--fanout', type=int, default=4, help="children per entry below the categories")
+    parser.add_argument('--requests', type=int, default=60, help="requests already in the store")
+    parser.add_argument('--store-latency', type=float, default=0.02)
+    parser.add_argument('--store-jitter', type=float, default=0.01)
+    parser.add_argument('--store-error-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="seconds per Bot API call")
+    parser.add_argument('--no-warmup', dest='warmup', action='store_false', help="start with a cold catalog cache")
+    parser.add_argument('--no-search-index', dest='search_index', action='store_false')
+    parser.add_argument('--settle', type=float, default=0.0, help="seconds to wait after startup before the load")
+    parser.add_argument('--inline-timeout', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
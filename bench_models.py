@@ -0,0 +1,62 @@
+"""Compare decode time and memory of store records as dicts and as models, e.g.
+
+    python bench_models.py --items 10000
+
+Builds a JSON listing shaped like the store's /items/ and /requests/
+responses and reports, per record type, the time to decode it and the memory
+held by the decoded records: plain json dicts, json + models, and orjson +
+models when orjson is installed.
+"""
+import argparse
+import json
+import timeit
+import tracemalloc
+import models
+from models import Item, Request
+
+
+def item_listing(count):
+    return json.dumps([
+        {'id': i, 'name': f'Phone {i}', 'brand': f'Brand {i % 50}', 'model': f'Model {i % 400}',
+         'subcategory': f'Subcategory {i % 20}', 'price': 100 + i % 900, 'description': 'x' * 40}
+        for i in range(count)
+    ]).encode()
+
+
+def request_listing(count):
+    return json.dumps([
+        {'id': i, 'user_id': 1000 + i, 'username': f'user{i}', 'name': f'User {i}', 'phone': '+100000000',
+         'address': f'{i} Main Street', 'additional_text': 'Please call before delivery', 'is_responded': i % 3 == 0}
+        for i in range(count)
+    ]).encode()
+
+
+def retained(decode, body):
+    """Bytes still allocated while the decoded records are alive."""
+    tracemalloc.start()
+    records = decode(body)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return size
+
+
+def decoders(record_type):
+    yield 'json dicts', json.loads
+    yield 'json + models', lambda body: models.decode(record_type, json.loads(body))
+    if models.orjson is not None:
+        yield 'orjson + models', lambda body: models.decode(record_type, models.orjson.loads(body))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare store records decoded as dicts and as models.")
+    parser.add_argument('--items', type=int, default=10000, help="records per listing")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'listing':<10} {'decoder':<16} {'ms/listing':>11} {'KiB':>9}")
+    for name, body, record_type in (('items', item_listing(args.items), Item),
+                                    ('requests', request_listing(args.items), Request)):
+        for label, decode in decoders(record_type):
+            seconds = min(timeit.repeat(lambda: decode(body), number=1, repeat=args.repeat))
+            print(f"{name:<10} {label:<16} {seconds * 1000:>11.2f} {retained(decode, body) / 1024:>9.0f}")
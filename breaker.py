@@ -0,0 +1,131 @@
+import logging
+import time
+from collections import deque
+from config import (STORE_BREAKER_FAILURES, STORE_BREAKER_RESET, STORE_LATENCY_WINDOW, STORE_TIMEOUT, STORE_MIN_TIMEOUT,
+STORE_TIMEOUT_PERCENTILE, STORE_TIMEOUT_MULTIPLIER, STORE_HEDGE_PERCENTILE, STORE_HEDGE_RATIO)
+from metrics import endpoint_name
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Percentiles are not trusted before an endpoint has this many samples
+MIN_SAMPLES = 20
+
+
+class CircuitBreaker:
+    """Stops calls to an endpoint after repeated failures.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are refused for reset_timeout seconds. Then it is half-open: a single
+    probe goes through, and its outcome closes or reopens the circuit. A
+    probe that never reports back (e.g. a cancelled call) is replaced by a
+    new one after another reset_timeout.
+    """
+
+    def __init__(self, name, failure_threshold=STORE_BREAKER_FAILURES, reset_timeout=STORE_BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_started = None
+
+    def allow(self):
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self._opened_at < self.reset_timeout:
+                return False
+            self.state = HALF_OPEN
+            self._probe_started = None
+        if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+            return False
+        self._probe_started = now
+        return True
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logging.info(f"Circuit for {self.name} closed")
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logging.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+            self._probe_started = None
+
+
+class LatencyWindow:
+    """The latest latencies of an endpoint, for percentile estimates."""
+
+    def __init__(self, size=STORE_LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._sorted = None
+
+    def observe(self, latency):
+        self._samples.append(latency)
+        self._sorted = None
+
+    def percentile(self, q):
+        """Return the q-th percentile, or None while there are too few samples."""
+        if len(self._samples) < MIN_SAMPLES:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self._samples)
+        return self._sorted[min(len(self._sorted) - 1, int(q / 100 * len(self._sorted)))]
+
+
+class EndpointHealth:
+    """Circuit breaker, latency window and hedging budget of one store endpoint."""
+
+    def __init__(self, name):
+        self.breaker = CircuitBreaker(name)
+        self.latencies = LatencyWindow()
+        self.requests = 0
+        self.shed = 0
+        self.pool_timeouts = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def timeout(self):
+        """Read timeout for the next call, from the endpoint's recent latencies."""
+        latency = self.latencies.percentile(STORE_TIMEOUT_PERCENTILE)
+        if latency is None:
+            return STORE_TIMEOUT
+        return min(STORE_TIMEOUT, max(STORE_MIN_TIMEOUT, latency * STORE_TIMEOUT_MULTIPLIER))
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None while hedging is not possible."""
+        if self.breaker.state != CLOSED or self.hedged >= STORE_HEDGE_RATIO * self.requests:
+            return None
+        return self.latencies.percentile(STORE_HEDGE_PERCENTILE)
+
+
+# Health per 'METHOD /endpoint/{id}/'
+_endpoints = {}
+
+
+def endpoint_health(method, path):
+    key = f'{method} {endpoint_name(path)}'
+    health = _endpoints.get(key)
+    if health is None:
+        health = _endpoints[key] = EndpointHealth(key)
+    return health
+
+
+def health_stats():
+    endpoints = _endpoints.values()
+    return {
+        'open_circuits': sum(1 for health in endpoints if health.breaker.state == OPEN),
+        'half_open_circuits': sum(1 for health in endpoints if health.breaker.state == HALF_OPEN),
+        'shed': sum(health.shed for health in endpoints),
+        'pool_timeouts': sum(health.pool_timeouts for health in endpoints),
+        'hedged': sum(health.hedged for health in endpoints),
+        'hedge_wins': sum(health.hedge_wins for health in endpoints),
+    }
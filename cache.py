@@ -0,0 +1,145 @@
+import asyncio
+import time
+from collections import OrderedDict
+from functools import wraps
+from config import CACHE_MAX_ENTRIES, CACHE_TTLS, CATALOG_PREFETCH_CONCURRENCY
+from snapshot import catalog_snapshot
+
+# Returned by TTLCache.get when a key is absent or expired
+MISSING = object()
+
+
+class TTLCache:
+    """Bounded in-process cache with per-entry expiry and LRU eviction."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=MISSING):
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def peek(self, key):
+        """Return a live entry without touching LRU order or counters."""
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return MISSING
+        return entry[1]
+
+    def set(self, key, value, ttl):
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, level=None):
+        """Drop every entry, or only the entries of one catalog level."""
+        if level is None:
+            self._data.clear()
+            return
+        for key in [key for key in self._data if key[0] == level]:
+            del self._data[key]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Shared cache for the category -> subcategory -> brand -> model -> item tree
+catalog_cache = TTLCache(CACHE_MAX_ENTRIES)
+
+
+def cache_key(level, *ids):
+    # Ids arrive as ints from the API and as strings from callback data
+    return (level,) + tuple(str(i) for i in ids)
+
+
+# Keys being revalidated in the background after a stale snapshot hit
+_revalidating = {}
+
+# Bounds the background refetches, so a crawl served from the snapshot does
+# not start one upstream request per entry at once
+_revalidation_slots = asyncio.Semaphore(CATALOG_PREFETCH_CONCURRENCY)
+
+
+def cached(level, record=None, persist=True):
+    """Serve an async API getter from catalog_cache, keyed by level and ids.
+
+    Empty results are not cached, since the API layer also reports failures
+    as [] or None. On a cache miss the on-disk snapshot is served while the
+    entry is refetched in the background (stale-while-revalidate), and it
+    also covers failed fetches. The wrapper's refresh() bypasses the cache
+    and stores the fresh value, and is_cached() tells whether a live entry
+    exists. Snapshot entries are decoded into the given record type when
+    first served. Levels created with persist=False skip the snapshot.
+    """
+    def decorator(func):
+        async def fetch(key, ids):
+            value = await func(*ids)
+            if value:
+                catalog_cache.set(key, value, CACHE_TTLS[level])
+                if persist:
+                    catalog_snapshot.put(key, value)
+            return value
+
+        async def refresh(*ids):
+            key = cache_key(level, *ids)
+            value = await fetch(key, ids)
+            if value:
+                return value
+            stale = catalog_snapshot.get(key, record) if persist else None
+            if stale is not None:
+                catalog_snapshot.stale_served += 1
+                return stale
+            return value
+
+        async def fetch_in_background(key, ids):
+            async with _revalidation_slots:
+                # Another caller may have refetched the entry while this one waited
+                if catalog_cache.peek(key) is MISSING:
+                    await fetch(key, ids)
+
+        def revalidate(key, ids):
+            if key not in _revalidating:
+                task = asyncio.create_task(fetch_in_background(key, ids))
+                _revalidating[key] = task
+                task.add_done_callback(lambda _: _revalidating.pop(key, None))
+
+        @wraps(func)
+        async def wrapper(*ids):
+            key = cache_key(level, *ids)
+            value = catalog_cache.get(key)
+            if value is not MISSING:
+                return value
+            stale = catalog_snapshot.get(key, record) if persist else None
+            if stale is not None:
+                catalog_snapshot.stale_served += 1
+                revalidate(key, ids)
+                return stale
+            return await refresh(*ids)
+
+        wrapper.refresh = refresh
+        wrapper.is_cached = lambda *ids: catalog_cache.peek(cache_key(level, *ids)) is not MISSING
+        return wrapper
+    return decorator
@@ -0,0 +1,65 @@
+import base64
+import binascii
+
+# Callback data layout, base64url encoded without padding:
+#   version byte | action byte | varint page | varint ids of the breadcrumb path
+# The path holds the ids from the category down to the current entry, so a
+# button can point at any screen, including its parent, without lookups.
+VERSION = 1
+
+# Telegram's limit for callback_data
+MAX_CALLBACK_DATA = 64
+
+# Actions
+NAV, MAKE_REQUEST, NOOP, WATCH, UNWATCH = 0, 1, 2, 3, 4
+
+
+def _write_varint(out, number):
+    while True:
+        byte = number & 0x7F
+        number >>= 7
+        if number:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varints(data):
+    numbers = []
+    number = shift = 0
+    for byte in data:
+        number |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            numbers.append(number)
+            number = shift = 0
+    if shift:
+        raise ValueError("truncated varint")
+    return numbers
+
+
+def encode(action, path=(), page=0):
+    out = bytearray((VERSION, action))
+    _write_varint(out, page)
+    for entry_id in path:
+        _write_varint(out, int(entry_id))
+    data = base64.urlsafe_b64encode(bytes(out)).rstrip(b'=').decode('ascii')
+    if len(data) > MAX_CALLBACK_DATA:
+        raise ValueError(f"callback data for path {path} is longer than {MAX_CALLBACK_DATA} bytes")
+    return data
+
+
+def decode(data):
+    """Return (action, path, page); raises ValueError for foreign or outdated data."""
+    try:
+        raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+    except (binascii.Error, ValueError):
+        raise ValueError(f"not a callback payload: {data!r}")
+    if len(raw) < 3 or raw[0] != VERSION:
+        raise ValueError(f"unsupported callback payload: {data!r}")
+    numbers = _read_varints(raw[2:])
+    if not numbers:
+        raise ValueError(f"callback payload without page: {data!r}")
+    return raw[1], tuple(numbers[1:]), numbers[0]
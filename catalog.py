@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from api import get_categories, get_subcategories, get_brands, get_models
+from config import CATALOG_CRAWL_CONCURRENCY, CATALOG_REFRESH_INTERVAL, CATALOG_PREFETCH_CONCURRENCY
+
+# Walk categories -> subcategories -> brands -> models with bounded parallelism
+# and return every model found, and whether every page along the way listed
+# something. The API layer reports failures as empty pages, so only a complete
+# walk shows what is gone from the catalog. The getters are cached, so a walk
+# also fills the catalog cache for each level it visits; with fresh=True every
+# level is refetched and the cache entries are renewed.
+
+
+async def crawl_models(concurrency=CATALOG_CRAWL_CONCURRENCY, fresh=False):
+    semaphore = asyncio.Semaphore(concurrency)
+    complete = True
+
+    async def fetch(getter, *ids):
+        nonlocal complete
+        async with semaphore:
+            page = await (getter.refresh if fresh else getter)(*ids)
+        if not page:
+            complete = False
+        return page
+
+    async def children(getter, parents):
+        pages = await asyncio.gather(*(fetch(getter, parent.id) for parent in parents))
+        return [child for page in pages for child in page]
+
+    categories = await fetch(get_categories)
+    subcategories = await children(get_subcategories, categories)
+    brands = await children(get_brands, subcategories)
+    models = await children(get_models, brands)
+    return models, complete
+
+
+async def walk_models(concurrency=CATALOG_CRAWL_CONCURRENCY, fresh=False):
+    models, _ = await crawl_models(concurrency, fresh)
+    return models
+
+# Fill the catalog cache before the bot starts answering
+
+
+async def warm_up(timeout):
+    try:
+        models = await asyncio.wait_for(walk_models(), timeout)
+        logging.info(f"Catalog warm-up loaded {len(models)} models")
+    except asyncio.TimeoutError:
+        logging.warning(f"Catalog warm-up did not finish within {timeout}s")
+
+# Renew the navigation levels before their cache entries expire
+
+
+async def refresh_catalog_forever(interval=CATALOG_REFRESH_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await walk_models(fresh=True)
+        except Exception as e:
+            logging.error(f"Catalog refresh failed: {e}")
+
+# Prefetches in flight, keyed by (getter, id), and the slots they share across
+# all users
+_prefetches = {}
+_prefetch_slots = asyncio.Semaphore(CATALOG_PREFETCH_CONCURRENCY)
+
+# Load the next level for entries a user is looking at, so opening one of
+# them is answered from the cache
+
+
+def prefetch(getter, ids):
+    for i in ids:
+        key = (getter, i)
+        if key in _prefetches or getter.is_cached(i):
+            continue
+        task = asyncio.create_task(_prefetch(getter, i))
+        _prefetches[key] = task
+        task.add_done_callback(lambda _, key=key: _prefetches.pop(key, None))
+
+
+async def _prefetch(getter, i):
+    async with _prefetch_slots:
+        # An earlier prefetch or a user may have loaded it while this one waited
+        if getter.is_cached(i):
+            return
+        try:
+            await getter(i)
+        except Exception as e:
+            logging.warning(f"Prefetch failed: {e}")
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from functools import wraps
+
+
+def single_flight(func):
+    """Share one in-flight call among concurrent callers with the same arguments.
+
+    The shared call is shielded, so a cancelled caller does not cancel it for
+    the others.
+    """
+    in_flight = {}
+
+    @wraps(func)
+    async def wrapper(*args):
+        task = in_flight.get(args)
+        if task is None:
+            task = asyncio.create_task(func(*args))
+            in_flight[args] = task
+            task.add_done_callback(lambda _: in_flight.pop(args, None))
+        return await asyncio.shield(task)
+    return wrapper
+
+
+class Debouncer:
+    """Run only the latest job per key after a quiet period.
+
+    Submitting a new job for a key cancels the previous one, whether it is
+    still waiting out the delay or already running. A job is called only once
+    its delay has passed; on_superseded, if given, is called with the
+    arguments of a job cancelled before it started.
+    """
+
+    def __init__(self, delay, on_superseded=None):
+        self.delay = delay
+        self.on_superseded = on_superseded
+        self._tasks = {}
+        self._started = set()
+        self.superseded = 0
+
+    def submit(self, key, job, *args):
+        previous = self._tasks.get(key)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+        task = asyncio.create_task(self._run(job, args))
+        self._tasks[key] = task
+        task.add_done_callback(lambda done: self._finished(key, done, args))
+        return task
+
+    async def _run(self, job, args):
+        await asyncio.sleep(self.delay)
+        self._started.add(asyncio.current_task())
+        await job(*args)
+
+    def _finished(self, key, task, args):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Covers tasks cancelled before their first step too, which never reach the sleep
+        if task.cancelled() and task not in self._started and self.on_superseded is not None:
+            self.on_superseded(*args)
+        self._started.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Debounced job for {key} failed: {task.exception()}")
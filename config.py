@@ -0,0 +1,161 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Telegram user ids allowed to use the admin commands, comma separated
+ADMINS = [int(admin_id) for admin_id in os.getenv('ADMINS', '1648265210').split(',') if admin_id.strip()]
+
+# Store API client settings
+STORE_BASE_URL = os.getenv('STORE_BASE_URL', 'https://store.4gmobiles.com')
+STORE_TIMEOUT = float(os.getenv('STORE_TIMEOUT', '10'))
+STORE_CONNECT_TIMEOUT = float(os.getenv('STORE_CONNECT_TIMEOUT', '5'))
+STORE_MAX_CONNECTIONS = int(os.getenv('STORE_MAX_CONNECTIONS', '20'))
+STORE_MAX_KEEPALIVE = int(os.getenv('STORE_MAX_KEEPALIVE', '10'))
+STORE_RETRIES = int(os.getenv('STORE_RETRIES', '2'))
+STORE_RETRY_BACKOFF = float(os.getenv('STORE_RETRY_BACKOFF', '0.2'))
+# Records requested per page from paginated list endpoints
+STORE_PAGE_SIZE = int(os.getenv('STORE_PAGE_SIZE', '100'))
+
+# Per-endpoint circuit breakers: open after this many consecutive failures, then
+# let one probe through after STORE_BREAKER_RESET seconds
+STORE_BREAKER_FAILURES = int(os.getenv('STORE_BREAKER_FAILURES', '5'))
+STORE_BREAKER_RESET = float(os.getenv('STORE_BREAKER_RESET', '30'))
+# Read timeouts adapt to each endpoint's recent latencies: the percentile times the
+# multiplier, kept between STORE_MIN_TIMEOUT and STORE_TIMEOUT
+STORE_LATENCY_WINDOW = int(os.getenv('STORE_LATENCY_WINDOW', '200'))
+STORE_TIMEOUT_PERCENTILE = float(os.getenv('STORE_TIMEOUT_PERCENTILE', '99'))
+STORE_TIMEOUT_MULTIPLIER = float(os.getenv('STORE_TIMEOUT_MULTIPLIER', '3'))
+STORE_MIN_TIMEOUT = float(os.getenv('STORE_MIN_TIMEOUT', '1'))
+# Hedged GETs send a second copy once the first is slower than this percentile,
+# for at most STORE_HEDGE_RATIO of the requests
+STORE_HEDGE_PERCENTILE = float(os.getenv('STORE_HEDGE_PERCENTILE', '95'))
+STORE_HEDGE_RATIO = float(os.getenv('STORE_HEDGE_RATIO', '0.1'))
+
+# Catalog cache settings (TTLs in seconds per catalog level)
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '5000'))
+CACHE_TTLS = {
+    'categories': float(os.getenv('CACHE_TTL_CATEGORIES', '3600')),
+    'subcategories': float(os.getenv('CACHE_TTL_SUBCATEGORIES', '1800')),
+    'brands': float(os.getenv('CACHE_TTL_BRANDS', '1800')),
+    'models': float(os.getenv('CACHE_TTL_MODELS', '900')),
+    'items': float(os.getenv('CACHE_TTL_ITEMS', '600')),
+    'item': float(os.getenv('CACHE_TTL_ITEM', '600')),
+    'stock': float(os.getenv('CACHE_TTL_STOCK', '30')),
+    'brand': float(os.getenv('CACHE_TTL_BRAND', '3600')),
+    'model': float(os.getenv('CACHE_TTL_MODEL', '3600')),
+    'subcategory': float(os.getenv('CACHE_TTL_SUBCATEGORY', '3600')),
+}
+
+# Inline search settings
+INLINE_DETAIL_CONCURRENCY = int(os.getenv('INLINE_DETAIL_CONCURRENCY', '8'))
+INLINE_LATENCY_BUDGET = float(os.getenv('INLINE_LATENCY_BUDGET', '2.0'))
+INLINE_DEBOUNCE_DELAY = float(os.getenv('INLINE_DEBOUNCE_DELAY', '0.3'))
+# Result caching policy passed to Telegram with every inline answer
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '300'))
+INLINE_IS_PERSONAL = os.getenv('INLINE_IS_PERSONAL', '0') == '1'
+
+# Catalog crawling and local search index settings
+CATALOG_CRAWL_CONCURRENCY = int(os.getenv('CATALOG_CRAWL_CONCURRENCY', '8'))
+CATALOG_WARMUP = os.getenv('CATALOG_WARMUP', '1') == '1'
+CATALOG_WARMUP_TIMEOUT = float(os.getenv('CATALOG_WARMUP_TIMEOUT', '30'))
+# Keep below the category to model TTLs so hot levels never expire
+CATALOG_REFRESH_INTERVAL = float(os.getenv('CATALOG_REFRESH_INTERVAL', '600'))
+CATALOG_PREFETCH_CONCURRENCY = int(os.getenv('CATALOG_PREFETCH_CONCURRENCY', '4'))
+SEARCH_INDEX_ENABLED = os.getenv('SEARCH_INDEX_ENABLED', '1') == '1'
+SEARCH_INDEX_REFRESH_INTERVAL = float(os.getenv('SEARCH_INDEX_REFRESH_INTERVAL', '900'))
+# Telegram accepts at most 50 results per inline answer
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', '50'))
+# Inline search results, one per normalized query, kept apart from the catalog cache
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '1000'))
+SEARCH_CACHE_TTL = float(os.getenv('CACHE_TTL_SEARCH', '60'))
+
+# Pending request index settings
+PENDING_RECONCILE_INTERVAL = float(os.getenv('PENDING_RECONCILE_INTERVAL', '300'))
+# Five entries with previews of this length stay under Telegram's 4096-char limit
+PENDING_PAGE_SIZE = int(os.getenv('PENDING_PAGE_SIZE', '5'))
+PENDING_TEXT_PREVIEW = int(os.getenv('PENDING_TEXT_PREVIEW', '300'))
+
+# User -> open conversation routing table
+# Seconds before a user found without a conversation is looked up in GET /messages/ again
+ROUTES_MIN_REBUILD_INTERVAL = float(os.getenv('ROUTES_MIN_REBUILD_INTERVAL', '60'))
+ROUTES_MISS_CACHE_SIZE = int(os.getenv('ROUTES_MISS_CACHE_SIZE', '10000'))
+
+# Catalog snapshot used for fast restarts and upstream outages
+SNAPSHOT_FLUSH_INTERVAL = float(os.getenv('SNAPSHOT_FLUSH_INTERVAL', '60'))
+# Seconds between reads of the entries other workers wrote; 0 turns it off for a single worker
+SNAPSHOT_RELOAD_INTERVAL = float(os.getenv('SNAPSHOT_RELOAD_INTERVAL', '300'))
+
+# Updates processed concurrently across chats (each chat stays in order)
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '32'))
+# Updates accepted at once, waiting behind their chat or running; later ones wait to be accepted
+UPDATE_MAX_PENDING = int(os.getenv('UPDATE_MAX_PENDING', '1000'))
+
+# Webhook mode (BOT_MODE=webhook); WEBHOOK_URL is registered with Telegram when set
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')
+# Connections Telegram may open to the webhook (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+# Updates received but not yet processed; UPDATE_WORKERS still bounds how many run
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+# Seconds to wait for room in WEBHOOK_QUEUE_SIZE before answering 503 so Telegram redelivers
+WEBHOOK_ENQUEUE_TIMEOUT = float(os.getenv('WEBHOOK_ENQUEUE_TIMEOUT', '5'))
+WEBHOOK_MAX_BODY_SIZE = int(os.getenv('WEBHOOK_MAX_BODY_SIZE', str(1024 * 1024)))
+
+# Shared state for conversations, user_data, routes and the catalog snapshot:
+# memory, sqlite (one host) or redis (several hosts)
+PERSISTENCE_BACKEND = os.getenv('PERSISTENCE_BACKEND', 'sqlite')
+PERSISTENCE_FILE = os.getenv('PERSISTENCE_FILE', 'bot_state.sqlite3')
+PERSISTENCE_REDIS_URL = os.getenv('PERSISTENCE_REDIS_URL', 'redis://localhost:6379/0')
+# Seconds between writes of PTB's in-memory user/chat/bot data and conversations
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv('PERSISTENCE_UPDATE_INTERVAL', '5'))
+# Seconds of silence after which a user's unfinished request or response flow is dropped
+CONVERSATION_TIMEOUT = float(os.getenv('CONVERSATION_TIMEOUT', '1800'))
+
+# Outbound message dispatcher (Telegram allows about 30 messages/s overall and 1/s per chat)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '25'))
+OUTBOUND_PER_CHAT_INTERVAL = float(os.getenv('OUTBOUND_PER_CHAT_INTERVAL', '1.0'))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+OUTBOUND_MAX_CONCURRENT_SENDS = int(os.getenv('OUTBOUND_MAX_CONCURRENT_SENDS', '8'))
+# Seconds admin notifications are held so bursts go out as one digest
+ADMIN_DIGEST_WINDOW = float(os.getenv('ADMIN_DIGEST_WINDOW', '3'))
+
+# Write-behind outbox for new requests and messages; give each worker its own WORKER_ID
+WORKER_ID = os.getenv('WORKER_ID', 'main')
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '10'))
+OUTBOX_FLUSH_INTERVAL = float(os.getenv('OUTBOX_FLUSH_INTERVAL', '1'))
+OUTBOX_RETRY_BASE = float(os.getenv('OUTBOX_RETRY_BASE', '1'))
+OUTBOX_RETRY_MAX = float(os.getenv('OUTBOX_RETRY_MAX', '300'))
+
+# Catalog keyboards: buttons per row and rows per page, plus the rendered keyboard cache
+KEYBOARD_COLUMNS = int(os.getenv('KEYBOARD_COLUMNS', '2'))
+KEYBOARD_ROWS = int(os.getenv('KEYBOARD_ROWS', '8'))
+KEYBOARD_CACHE_SIZE = int(os.getenv('KEYBOARD_CACHE_SIZE', '2000'))
+KEYBOARD_CACHE_TTL = float(os.getenv('KEYBOARD_CACHE_TTL', '3600'))
+
+# Rendered product cards, one per item and stock state
+PRODUCT_CARD_CACHE_SIZE = int(os.getenv('PRODUCT_CARD_CACHE_SIZE', '2000'))
+PRODUCT_CARD_CACHE_TTL = float(os.getenv('PRODUCT_CARD_CACHE_TTL', '3600'))
+
+# Prometheus metrics endpoint (METRICS_PORT=0 turns it off; each worker on a host needs
+# its own port) and JSON trace logs of handler and store API timings on the 'trace' logger
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+TRACE_LOG = os.getenv('TRACE_LOG', '0') == '1'
+
+# "Notify me" stock subscriptions: watched items are checked every STOCK_POLL_MIN_INTERVAL
+# seconds at first, backing off by STOCK_POLL_BACKOFF while they stay out of stock.
+# The poller runs on the worker whose WORKER_ID is STOCK_WATCH_WORKER unless
+# STOCK_WATCH_ENABLED says otherwise; with more than one poller, watchers are
+# notified once per poller.
+STOCK_WATCH_WORKER = os.getenv('STOCK_WATCH_WORKER', 'main')
+STOCK_WATCH_ENABLED = os.getenv('STOCK_WATCH_ENABLED', '1' if WORKER_ID == STOCK_WATCH_WORKER else '0') == '1'
+STOCK_POLL_MIN_INTERVAL = float(os.getenv('STOCK_POLL_MIN_INTERVAL', '60'))
+STOCK_POLL_MAX_INTERVAL = float(os.getenv('STOCK_POLL_MAX_INTERVAL', '1800'))
+STOCK_POLL_BACKOFF = float(os.getenv('STOCK_POLL_BACKOFF', '1.5'))
+STOCK_POLL_CONCURRENCY = int(os.getenv('STOCK_POLL_CONCURRENCY', '10'))
+STOCK_POLL_TICK = float(os.getenv('STOCK_POLL_TICK', '5'))
@@ -0,0 +1,215 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from collections import deque
+from datetime import timedelta
+from telegram.error import BadRequest, RetryAfter, NetworkError
+from config import (ADMINS, OUTBOUND_GLOBAL_RATE, OUTBOUND_PER_CHAT_INTERVAL, OUTBOUND_MAX_RETRIES, OUTBOUND_MAX_CONCURRENT_SENDS,
+ADMIN_DIGEST_WINDOW)
+from templates import split_message
+
+# Telegram's limit for a single text message
+MAX_MESSAGE_LENGTH = 4096
+
+DIGEST_SEPARATOR = "\n\n➖➖➖\n\n"
+
+
+class OutboundDispatcher:
+    """Queue for outgoing messages that respects Telegram's flood limits.
+
+    Messages are sent at most global_rate per second overall and one per
+    per_chat_interval seconds per chat, in order within a chat. RetryAfter
+    pauses all sending for the requested time and the message is retried, as
+    are timeouts and network errors, up to max_retries times. Notifications
+    sent through notify() are held for digest_window seconds and merged into
+    digest messages per chat.
+    """
+
+    def __init__(self, global_rate=OUTBOUND_GLOBAL_RATE, per_chat_interval=OUTBOUND_PER_CHAT_INTERVAL,
+                 max_retries=OUTBOUND_MAX_RETRIES, max_concurrent_sends=OUTBOUND_MAX_CONCURRENT_SENDS,
+                 digest_window=ADMIN_DIGEST_WINDOW):
+        self.global_interval = 1 / global_rate
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.max_concurrent_sends = max_concurrent_sends
+        self.digest_window = digest_window
+        self.bot = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._queues = {}      # chat_id -> deque of (text, kwargs, future)
+        self._ready = []       # heap of (ready_at, seq, chat_id) for chats with queued messages
+        self._last_sent = {}   # chat_id -> loop time of the last send
+        self._digests = {}     # (chat_id, parse_mode) -> list of texts waiting to be merged
+        self._seq = itertools.count()
+        self._next_global = 0.0
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._sends = None
+        self._tasks = set()
+        self._runner = None
+
+    def start(self, bot):
+        self.bot = bot
+        self._sends = asyncio.Semaphore(self.max_concurrent_sends)
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=10):
+        """Flush pending digests and give queued messages a chance to go out."""
+        for key in list(self._digests):
+            self._flush_digest(key)
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Dropping {self.queue_depth()} outbound messages at shutdown")
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+
+    async def _drain(self):
+        while self._queues or self._tasks:
+            await asyncio.sleep(0.05)
+
+    def queue_depth(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self):
+        return {'queued': self.queue_depth(), 'chats': len(self._queues), 'sent': self.sent,
+                'failed': self.failed, 'retried': self.retried}
+
+    def send(self, chat_id, text, **kwargs):
+        """Queue a message and return a future resolved with the sent Message."""
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+            self._schedule(chat_id)
+        queue.append((text, kwargs, future))
+        return future
+
+    def notify(self, chat_id, text, parse_mode=None):
+        """Queue a notification that may be merged with others sent to the same chat.
+
+        Texts longer than a message are split at line breaks first.
+        """
+        key = (chat_id, parse_mode)
+        texts = self._digests.get(key)
+        if texts is None:
+            texts = self._digests[key] = []
+            asyncio.get_running_loop().call_later(self.digest_window, self._flush_digest, key)
+        texts.extend(split_message(text, MAX_MESSAGE_LENGTH))
+
+    def notify_admins(self, text, parse_mode=None):
+        for admin_id in ADMINS:
+            self.notify(admin_id, text, parse_mode)
+
+    def _flush_digest(self, key):
+        texts = self._digests.pop(key, None)
+        if not texts:
+            return
+        chat_id, parse_mode = key
+        for digest in merge_texts(texts):
+            future = self.send(chat_id, digest, parse_mode=parse_mode)
+            # Nobody awaits digests; failures are already logged by _deliver
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def _schedule(self, chat_id):
+        loop_time = asyncio.get_running_loop().time()
+        ready_at = max(loop_time, self._last_sent.get(chat_id, 0.0) + self.per_chat_interval)
+        heapq.heappush(self._ready, (ready_at, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = None
+            if self._ready:
+                delay = max(self._ready[0][0], self._paused_until) - loop.time()
+                if delay <= 0:
+                    _, _, chat_id = heapq.heappop(self._ready)
+                    await self._sends.acquire()
+                    await self._global_slot()
+                    text, kwargs, future = self._queues[chat_id].popleft()
+                    task = asyncio.create_task(self._deliver(chat_id, text, kwargs, future))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                    continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _global_slot(self):
+        loop = asyncio.get_running_loop()
+        slot = max(loop.time(), self._next_global, self._paused_until)
+        self._next_global = slot + self.global_interval
+        if slot > loop.time():
+            await asyncio.sleep(slot - loop.time())
+
+    async def _deliver(self, chat_id, text, kwargs, future):
+        loop = asyncio.get_running_loop()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    message = await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                except RetryAfter as e:
+                    retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+                    # Flood control applies to the whole bot, so pause every chat
+                    self._paused_until = max(self._paused_until, loop.time() + retry_after)
+                    error = e
+                except BadRequest as e:
+                    # BadRequest is a NetworkError in PTB, but resending cannot fix it
+                    error = e
+                    break
+                except NetworkError as e:
+                    error = e
+                except Exception as e:
+                    error = e
+                    break
+                else:
+                    self.sent += 1
+                    if not future.done():
+                        future.set_result(message)
+                    return
+                if attempt < self.max_retries:
+                    self.retried += 1
+                    await asyncio.sleep(max(self._paused_until - loop.time(), 2 ** attempt))
+            self.failed += 1
+            logging.error(f"Failed to send message to {chat_id}: {error}")
+            if not future.done():
+                future.set_exception(error)
+        finally:
+            self._sends.release()
+            self._last_sent[chat_id] = loop.time()
+            if len(self._last_sent) > 10000:
+                # Chats idle for longer than the per-chat interval need no history
+                cutoff = loop.time() - self.per_chat_interval
+                self._last_sent = {chat: sent for chat, sent in self._last_sent.items() if sent > cutoff}
+            queue = self._queues.get(chat_id)
+            if queue:
+                self._schedule(chat_id)
+            elif queue is not None:
+                del self._queues[chat_id]
+
+
+def merge_texts(texts, limit=MAX_MESSAGE_LENGTH):
+    """Join texts into as few messages as fit the length limit."""
+    if len(texts) == 1:
+        return texts
+    digests = []
+    current = ''
+    for text in texts:
+        candidate = f"{current}{DIGEST_SEPARATOR}{text}" if current else text
+        if len(candidate) > limit and current:
+            digests.append(current)
+            current = text
+        else:
+            current = candidate
+    digests.append(current)
+    return digests
+
+
+# Shared dispatcher, started in post_init with the application's bot
+dispatcher = OutboundDispatcher()
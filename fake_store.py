@@ -0,0 +1,204 @@
+"""Local stand-in for the store API, for load tests and benchmarks, e.g.
+
+    python fake_store.py --port 8000 --categories 5 --fanout 4 --latency 0.02 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+from urllib.parse import urlsplit, parse_qs
+
+BRANDS = ['Samsung', 'Apple', 'Xiaomi', 'Google', 'Nokia', 'Oppo', 'Motorola', 'Honor']
+SERIES = ['Galaxy', 'Pixel', 'Redmi', 'Note', 'Edge', 'Reno', 'Magic', 'Pro']
+COLORS = ['Black', 'Silver', 'Blue', 'Green', 'Gold', 'Purple']
+REASONS = {200: 'OK', 201: 'Created', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+def endpoint_name(path):
+    # Same series names as metrics.py, which is not imported so the store never loads the bot's config
+    return re.sub(r'/\d+(?=/|$)', '/{id}', path)
+
+
+class FakeStore:
+    """In-memory catalog, requests and messages served over HTTP like the store API.
+
+    The catalog has `categories` categories and `fanout` children per entry
+    on every level below, so categories * fanout**4 items. Every response
+    is delayed by latency +/- jitter seconds, and error_rate of them fail
+    with 500. Calls are counted per endpoint in `calls`.
+    """
+
+    def __init__(self, categories=5, fanout=4, latency=0.02, jitter=0.01, error_rate=0.0, requests=50,
+                 route_users=(), admin_id=1, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = {}
+        self.errors = {}
+        self._random = random.Random(seed)
+        self._ids = {}
+        self.categories = []
+        self.children = {}  # (level, parent id) -> entries
+        self.entries = {}   # (level, id) -> entry
+        self.items = {}     # item id -> details
+        self.stocks = {}
+        self._build_catalog(categories, fanout)
+        self.requests = {}
+        self.messages = []
+        self._build_requests(requests, list(route_users), admin_id)
+
+    def _next_id(self, level):
+        self._ids[level] = self._ids.get(level, 0) + 1
+        return self._ids[level]
+
+    def _add(self, level, parent_level, parent_id, name):
+        entry = {'id': self._next_id(level), 'name': name}
+        self.children.setdefault((parent_level, parent_id), []).append(entry)
+        self.entries[(level, entry['id'])] = entry
+        return entry
+
+    def _build_catalog(self, categories, fanout):
+        for c in range(categories):
+            category = self._add('category', None, None, f"Category {c + 1}")
+            self.categories.append(category)
+            for s in range(fanout):
+                subcategory = self._add('subcategory', 'category', category['id'], f"{category['name']} Group {s + 1}")
+                for b in range(fanout):
+                    brand = self._add('brand', 'subcategory', subcategory['id'], BRANDS[(s * fanout + b) % len(BRANDS)])
+                    for m in range(fanout):
+                        model = self._add('model', 'brand', brand['id'], f"{SERIES[(b + m) % len(SERIES)]} {c * 10 + m + 1}")
+                        for i in range(fanout):
+                            name = f"{brand['name']} {model['name']} {COLORS[i % len(COLORS)]}"
+                            item = self._add('item', 'model', model['id'], name)
+                            self.items[item['id']] = {
+                                'id': item['id'], 'name': name, 'brand': brand['name'], 'model': model['name'],
+                                'subcategory': subcategory['name'], 'price': 100 + self._random.randrange(900),
+                            }
+                            self.stocks[item['id']] = {'item': item['id'], 'is_available': self._random.random() < 0.7,
+                                                       'quantity': self._random.randrange(20)}
+
+    def _build_requests(self, count, route_users, admin_id):
+        for n in range(count):
+            user_id = route_users[n % len(route_users)] if route_users else 5000 + n
+            self._create_request({'user_id': user_id, 'username': f'user{user_id}', 'name': f'User {user_id}',
+                                  'phone': '+10000000000', 'address': 'Main street 1',
+                                  'additional_text': f"Looking for a phone, request {n + 1}", 'is_responded': n % 3 == 0})
+        for request in list(self.requests.values()):
+            self.messages.append({'id': len(self.messages) + 1, 'request': request['id'], 'sender_id': admin_id,
+                                  'user_id': request['user_id'], 'content': 'We have it in stock.'})
+
+    def _create_request(self, data):
+        request = {'is_responded': False, **data, 'id': len(self.requests) + 1}
+        self.requests[request['id']] = request
+        return request
+
+    def search(self, query, limit=50):
+        words = query.lower().split()
+        matches = [{'id': item['id'], 'name': item['name']} for item in self.items.values()
+                   if all(word in item['name'].lower() for word in words)]
+        return matches[:limit]
+
+    def route(self, method, path, query, body):
+        """Return (status, payload) for a request."""
+        if method == 'POST':
+            if path == '/requests/':
+                return 201, self._create_request(body)
+            if path == '/messages/':
+                message = {**body, 'id': len(self.messages) + 1}
+                self.messages.append(message)
+                return 201, message
+            return 405, {'detail': 'Method not allowed'}
+
+        if path == '/categories/':
+            return 200, self.categories
+        if path == '/items/search':
+            return 200, self.search(query.get('q', [''])[0])
+        if path == '/requests/':
+            return 200, list(self.requests.values())
+        if path == '/messages/':
+            return 200, self.messages
+        match = re.fullmatch(r'/(\w+)/(\d+)/(?:(\w+)/)?', path)
+        if match:
+            collection, entry_id, child = match.group(1), int(match.group(2)), match.group(3)
+            level = {'categories': 'category', 'subcategories': 'subcategory', 'brands': 'brand', 'models': 'model',
+                     'items': 'item', 'requests': 'request'}.get(collection)
+            if child == 'stocks' and entry_id in self.stocks:
+                return 200, self.stocks[entry_id]
+            if child and (level, entry_id) in self.entries:
+                return 200, self.children.get((level, entry_id), [])
+            if not child and level == 'item' and entry_id in self.items:
+                return 200, self.items[entry_id]
+            if not child and level == 'request' and entry_id in self.requests:
+                return 200, self.requests[entry_id]
+            if not child and (level, entry_id) in self.entries:
+                return 200, self.entries[(level, entry_id)]
+        return 404, {'detail': 'Not found.'}
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                body = json.loads(await reader.readexactly(length)) if length else None
+
+                url = urlsplit(target)
+                endpoint = f"{method} {endpoint_name(url.path)}"
+                self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+                delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+                if delay:
+                    await asyncio.sleep(delay)
+                if self._random.random() < self.error_rate:
+                    status, payload = 500, {'detail': 'Injected failure'}
+                else:
+                    status, payload = self.route(method, url.path, parse_qs(url.query), body)
+                if status >= 400:
+                    self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start serving and return the asyncio server; port 0 picks a free port."""
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    def reset_counts(self):
+        self.calls.clear()
+        self.errors.clear()
+
+
+async def main(args):
+    store = FakeStore(args.categories, args.fanout, args.latency, args.jitter, args.error_rate, seed=args.seed)
+    server = await store.start(args.host, args.port)
+    print(f"Fake store with {len(store.items)} items on http://{args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve a fake store API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--categories', type=int, default=5)
+    parser.add_argument('--fanout', type=int, default=4, help="children per entry below the categories")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of responses failing with 500")
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
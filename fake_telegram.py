@@ -0,0 +1,147 @@
+"""Send fake Telegram updates to a local webhook, e.g.
+
+    python fake_telegram.py --text /start --users 50 --count 200
+
+FakeBotRequest stands in for the Bot API itself, so an Application can run
+without network access (see bench.py).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+import httpx
+from telegram.request import BaseRequest
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': f'user{user_id}'}
+
+
+def _message(user_id, text):
+    message = {
+        'message_id': next(_update_ids),
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': _user(user_id),
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return message
+
+
+def message_update(user_id, text):
+    return {'update_id': next(_update_ids), 'message': _message(user_id, text)}
+
+
+def callback_update(user_id, data):
+    return {
+        'update_id': next(_update_ids),
+        'callback_query': {
+            'id': str(next(_update_ids)),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': _message(user_id, 'Please choose:'),
+        },
+    }
+
+
+def inline_update(user_id, query):
+    return {
+        'update_id': next(_update_ids),
+        'inline_query': {'id': str(next(_update_ids)), 'from': _user(user_id), 'query': query, 'offset': ''},
+    }
+
+
+class FakeBotRequest(BaseRequest):
+    """Bot API transport on which every method succeeds after `latency` seconds.
+
+    Calls are counted per method in `calls`. expect_answer() returns a
+    future resolved when the bot answers the given inline query.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = {}
+        self._answers = {}
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def expect_answer(self, inline_query_id):
+        future = asyncio.get_running_loop().create_future()
+        self._answers[str(inline_query_id)] = future
+        return future
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        name = url.rsplit('/', 1)[-1]
+        self.calls[name] = self.calls.get(name, 0) + 1
+        params = request_data.parameters if request_data else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if name == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        elif name in ('sendMessage', 'editMessageText'):
+            result = {
+                'message_id': params.get('message_id') or next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+        else:
+            result = True
+        if name == 'answerInlineQuery':
+            future = self._answers.pop(str(params.get('inline_query_id')), None)
+            if future is not None and not future.done():
+                future.set_result(asyncio.get_running_loop().time())
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+# Post updates to the webhook with bounded concurrency and return the HTTP status counts
+
+
+async def send_updates(url, updates, secret_token='', concurrency=10):
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret_token} if secret_token else {}
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async with httpx.AsyncClient(headers=headers) as client:
+        async def send(update):
+            async with semaphore:
+                response = await client.post(url, json=update)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        await asyncio.gather(*(send(update) for update in updates))
+    return statuses
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Send fake Telegram updates to a local webhook.")
+    parser.add_argument('--url', default='http://127.0.0.1:8443/telegram')
+    parser.add_argument('--secret', default='')
+    parser.add_argument('--text', default='/start', help="message text, or callback data with --callback")
+    parser.add_argument('--callback', action='store_true', help="send callback queries instead of messages")
+    parser.add_argument('--inline', action='store_true', help="send inline queries instead of messages")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    args = parser.parse_args()
+
+    make_update = callback_update if args.callback else inline_update if args.inline else message_update
+    updates = [make_update(1000 + i % args.users, args.text) for i in range(args.count)]
+    started = time.perf_counter()
+    statuses = asyncio.run(send_updates(args.url, updates, args.secret, args.concurrency))
+    elapsed = time.perf_counter() - started
+    print(f"Sent {args.count} updates in {elapsed:.2f}s ({args.count / elapsed:.0f}/s): {statuses}")
@@ -0,0 +1,57 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from cache import TTLCache, MISSING
+from callbacks import encode, NAV, MAKE_REQUEST, NOOP, WATCH, UNWATCH
+from config import KEYBOARD_COLUMNS, KEYBOARD_ROWS, KEYBOARD_CACHE_SIZE, KEYBOARD_CACHE_TTL
+
+PAGE_SIZE = KEYBOARD_COLUMNS * KEYBOARD_ROWS
+
+
+def back_button(path):
+    return InlineKeyboardButton("⬅️ Back", callback_data=encode(NAV, path[:-1]))
+
+
+# Rendered keyboards keyed by (breadcrumb path, page). Each entry keeps the
+# list it was rendered from: the catalog cache hands out a new list when it
+# refetches a level, which invalidates the keyboard along with it.
+keyboard_cache = TTLCache(KEYBOARD_CACHE_SIZE)
+
+
+def level_keyboard(path, entries, page=0):
+    """Return the paginated, multi-column keyboard listing the children of path."""
+    path = tuple(path)
+    key = (path, page)
+    cached = keyboard_cache.get(key)
+    if cached is not MISSING and cached[0] is entries:
+        return cached[1]
+
+    pages = max(1, -(-len(entries) // PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    visible = entries[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+    buttons = [InlineKeyboardButton(entry.name, callback_data=encode(NAV, path + (entry.id,))) for entry in visible]
+    keyboard = [buttons[i:i + KEYBOARD_COLUMNS] for i in range(0, len(buttons), KEYBOARD_COLUMNS)]
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("◀️", callback_data=encode(NAV, path, page - 1)))
+        navigation.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=encode(NOOP)))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton("▶️", callback_data=encode(NAV, path, page + 1)))
+        keyboard.append(navigation)
+    if path:
+        keyboard.append([back_button(path)])
+
+    markup = InlineKeyboardMarkup(keyboard)
+    keyboard_cache.set(key, (entries, markup), KEYBOARD_CACHE_TTL)
+    return markup
+
+
+def item_keyboard(path, available=True, watching=False):
+    """Keyboard under a product card: make a request, watch the stock of an
+    unavailable item, or go back to the item list."""
+    keyboard = [[InlineKeyboardButton("Make Request", callback_data=encode(MAKE_REQUEST, path))]]
+    if watching:
+        keyboard.append([InlineKeyboardButton("🔕 Stop notifying me", callback_data=encode(UNWATCH, path))])
+    elif not available:
+        keyboard.append([InlineKeyboardButton("🔔 Notify me when in stock", callback_data=encode(WATCH, path))])
+    keyboard.append([back_button(path)])
+    return InlineKeyboardMarkup(keyboard)
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from functools import wraps
+from config import METRICS_HOST, METRICS_PORT, TRACE_LOG
+
+# Upper bounds in seconds; Telegram gives up on a callback answer after about 15s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15)
+
+trace_logger = logging.getLogger('trace')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, value in self._values.items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # label values -> [count per bucket..., count above the last bucket, sum]
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        else:
+            series[len(self.buckets)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {series[-1]}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Metrics rendered in the Prometheus text format.
+
+    Besides counters and histograms, components register their existing
+    stats() methods; every numeric value is exported as a gauge named
+    bot_<component>_<key> when the metrics are scraped.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._stats = {}
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, component, stats):
+        self._stats[component] = stats
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for component, stats in self._stats.items():
+            try:
+                values = stats()
+            except Exception as e:
+                logging.error(f"Collecting {component} stats failed: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f'# TYPE bot_{component}_{key} gauge')
+                    lines.append(f'bot_{component}_{key} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# Shared registry and the metrics recorded across the bot
+registry = Registry()
+upstream_latency = registry.histogram(
+    'store_request_duration_seconds', 'Store API request latency per attempt', ('method', 'endpoint'))
+upstream_errors = registry.counter(
+    'store_request_errors_total', 'Store API responses other than 2xx, and transport errors', ('method', 'endpoint', 'status'))
+handler_latency = registry.histogram('handler_duration_seconds', 'Telegram handler latency', ('handler',))
+handler_errors = registry.counter('handler_errors_total', 'Telegram handlers that raised', ('handler',))
+inline_latency = registry.histogram(
+    'inline_query_duration_seconds', 'Time from receiving an inline query to answering it, debounce included', ('outcome',))
+
+
+def trace(event, **fields):
+    """Write a structured trace record when TRACE_LOG is enabled."""
+    if TRACE_LOG:
+        trace_logger.info(json.dumps({'event': event, 'ts': round(time.time(), 6), **fields}, default=str))
+
+
+def endpoint_name(path):
+    # Collapse ids so each endpoint is one series: /items/12/ -> /items/{id}/
+    return re.sub(r'/\d+(?=/|$)', '/{id}', path)
+
+
+def observe_upstream(method, path, status, duration):
+    """Record one store API attempt; status is None when it never got a response."""
+    endpoint = endpoint_name(path)
+    upstream_latency.observe(duration, method=method, endpoint=endpoint)
+    if status is None or status >= 300:
+        upstream_errors.inc(method=method, endpoint=endpoint, status=status or 'transport')
+    trace('upstream', method=method, endpoint=endpoint, status=status, duration=round(duration, 6))
+
+# Time a Telegram handler and count the ones that raise
+
+
+def measure_handler(func):
+    name = func.__name__
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        failed = False
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            failed = True
+            handler_errors.inc(handler=name)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            handler_latency.observe(duration, handler=name)
+            trace('handler', handler=name, duration=round(duration, 6), failed=failed)
+    return wrapper
+
+# Serve GET /metrics for Prometheus; returns the server, or None when METRICS_PORT is 0
+# or the port cannot be bound
+
+
+async def serve_metrics(host=METRICS_HOST, port=METRICS_PORT):
+    if not port:
+        return None
+
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split(' ')
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                body = registry.render().encode()
+                head = "HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            else:
+                body = b''
+                head = "HTTP/1.1 404 Not Found\r\n"
+            writer.write(f"{head}Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    try:
+        server = await asyncio.start_server(handle, host, port)
+    except OSError as e:
+        # e.g. another worker on this host already serves the port; the bot runs without it
+        logging.error(f"Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    logging.info(f"Metrics available on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,131 @@
+import json
+from dataclasses import dataclass, fields
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Records decoded from the store API. Each is decoded once at the API boundary
+# and keeps only the fields the bot uses; ids are ints from then on. Slots
+# make them much smaller than the dicts they replace.
+
+
+def loads(data):
+    """Decode a JSON document, with orjson when it is installed."""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _int(value):
+    return int(value) if value is not None else None
+
+
+@dataclass(slots=True)
+class CatalogEntry:
+    id: int
+    name: str
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(int(data['id']), data['name'])
+
+
+@dataclass(slots=True)
+class Category(CatalogEntry):
+    pass
+
+
+@dataclass(slots=True)
+class Subcategory(CatalogEntry):
+    pass
+
+
+@dataclass(slots=True)
+class Brand(CatalogEntry):
+    pass
+
+
+@dataclass(slots=True)
+class Model(CatalogEntry):
+    pass
+
+
+@dataclass(slots=True)
+class Item:
+    """An item; listings and search results only fill in id and name."""
+
+    id: int
+    name: str
+    brand: str = None
+    model: str = None
+    subcategory: str = None
+    price: float = None
+
+    @property
+    def has_details(self):
+        return self.brand is not None
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(int(data['id']), data['name'], data.get('brand'), data.get('model'), data.get('subcategory'),
+                   data.get('price'))
+
+
+@dataclass(slots=True)
+class Stock:
+    item: int
+    is_available: bool
+    quantity: int = None
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(_int(data.get('item')), bool(data.get('is_available')), data.get('quantity'))
+
+
+@dataclass(slots=True)
+class Request:
+    id: int
+    user_id: int
+    username: str
+    name: str
+    phone: str
+    address: str
+    additional_text: str
+    is_responded: bool
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(int(data['id']), _int(data.get('user_id')), data.get('username'), data.get('name'),
+                   data.get('phone'), data.get('address'), data.get('additional_text'), bool(data.get('is_responded')))
+
+
+@dataclass(slots=True)
+class Message:
+    id: int
+    request: int
+    sender_id: int
+    user_id: int
+    content: str
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(_int(data.get('id')), _int(data.get('request')), _int(data.get('sender_id')),
+                   _int(data.get('user_id')), data.get('content'))
+
+
+def decode(record_type, data):
+    """Decode a JSON object or array of objects into records; None stays None."""
+    if data is None:
+        return None
+    if isinstance(data, list):
+        return [record_type.from_json(entry) for entry in data]
+    return record_type.from_json(data)
+
+
+def to_json(value):
+    """Plain form of a record or list of records, for the persistence backend."""
+    if isinstance(value, list):
+        return [to_json(entry) for entry in value]
+    if value is None or isinstance(value, dict):
+        return value
+    return {field.name: getattr(value, field.name) for field in fields(value)}
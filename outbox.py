@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+import uuid
+from api import post_json, request_payload, message_payload
+from models import Request
+from config import WORKER_ID, OUTBOX_BATCH_SIZE, OUTBOX_FLUSH_INTERVAL, OUTBOX_RETRY_BASE, OUTBOX_RETRY_MAX
+from pending import pending_requests
+
+PATHS = {'request': '/requests/', 'message': '/messages/'}
+
+
+def _is_permanent(status_code):
+    # Client errors other than timeouts and rate limits will fail again on retry
+    return status_code is not None and 400 <= status_code < 500 and status_code not in (408, 429)
+
+
+class Outbox:
+    """Durable write-behind queue for new requests and messages.
+
+    Submissions are journaled in the persistence backend and acknowledged
+    at once, then posted to the store in batches. Failed posts are retried
+    with exponential backoff; every entry carries an Idempotency-Key so a
+    retry after a lost response is not stored twice by a store that honours
+    the header. Entries the store rejects outright are moved aside under
+    outbox_dead: instead of being retried forever. Entries of one user are
+    posted one at a time in submission order, and none is posted while an
+    earlier one of the same user waits for its retry; up to
+    OUTBOX_BATCH_SIZE users' entries are posted at once.
+    """
+
+    def __init__(self, backend=None, worker_id=WORKER_ID):
+        self.backend = backend
+        # Each worker flushes only its own journal
+        self.prefix = f'outbox:{worker_id}:'
+        self.sent = 0
+        self.failed = 0
+        self._wakeup = asyncio.Event()
+        self._flushing = asyncio.Lock()
+        self._depth = 0
+
+    def depth(self):
+        return self._depth
+
+    def stats(self):
+        return {'queued': self._depth, 'sent': self.sent, 'failed': self.failed}
+
+    async def submit(self, kind, data):
+        entry = {'kind': kind, 'data': data, 'key': str(uuid.uuid4()), 'attempts': 0, 'next_attempt': 0}
+        # Zero-padded nanosecond keys keep the journal in submission order
+        await self.backend.set(f'{self.prefix}{time.time_ns():020d}-{entry["key"][:8]}', entry)
+        self._depth += 1
+        self._wakeup.set()
+
+    async def flush(self):
+        async with self._flushing:
+            entries = await self.backend.items(self.prefix)
+            self._depth = len(entries)
+            queues = {}
+            for key, entry in sorted(entries.items()):
+                queues.setdefault(entry['data'].get('user_id'), []).append((key, entry))
+            semaphore = asyncio.Semaphore(OUTBOX_BATCH_SIZE)
+            await asyncio.gather(*(self._send_in_order(queue, semaphore) for queue in queues.values()))
+
+    async def _send_in_order(self, queue, semaphore):
+        async with semaphore:
+            now = time.time()
+            for key, entry in queue:
+                if entry['next_attempt'] > now or not await self._send(key, entry):
+                    return
+
+    async def _send(self, key, entry):
+        """Post one entry; False when it stays in the journal for a retry."""
+        try:
+            status_code, body = await post_json(PATHS[entry['kind']], entry['data'], idempotency_key=entry['key'])
+        except Exception as e:
+            logging.error(f"Posting outbox entry {key} failed: {e!r}")
+            status_code, body = None, None
+        if body is not None or status_code == 201:
+            await self.backend.delete(key)
+            self._depth -= 1
+            self.sent += 1
+            if entry['kind'] == 'request':
+                try:
+                    pending_requests.add(Request.from_json(body))
+                except (KeyError, TypeError, ValueError):
+                    # Picked up by the next reconcile instead
+                    logging.warning(f"Store returned no usable request for outbox entry {key}")
+        elif status_code == 409:
+            # The store already has this idempotency key, so an earlier attempt got through
+            await self.backend.delete(key)
+            self._depth -= 1
+        elif _is_permanent(status_code):
+            logging.error(f"Store rejected outbox entry {key} with status {status_code}; moved to outbox_dead")
+            await self.backend.set(f'outbox_dead:{key[len("outbox:"):]}', entry)
+            await self.backend.delete(key)
+            self._depth -= 1
+            self.failed += 1
+        else:
+            entry['attempts'] += 1
+            entry['next_attempt'] = time.time() + min(OUTBOX_RETRY_BASE * 2 ** entry['attempts'], OUTBOX_RETRY_MAX)
+            await self.backend.set(key, entry)
+            return False
+        return True
+
+    async def run_forever(self, interval=OUTBOX_FLUSH_INTERVAL):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Outbox flush failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Shared outbox for this worker; app.build_application attaches the backend
+outbox = Outbox()
+
+# Queue a new request for the store
+
+
+async def queue_request(user_id, username, name, phone, address, additional_text):
+    await outbox.submit('request', request_payload(user_id, username, name, phone, address, additional_text))
+
+# Queue a new message for the store
+
+
+async def queue_message(request_id, sender_id, user_id, content):
+    await outbox.submit('message', message_payload(request_id, sender_id, user_id, content))
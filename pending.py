@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from api import iter_requests
+from config import PENDING_RECONCILE_INTERVAL
+
+
+class PendingRequests:
+    """Local index of requests that have not been responded to yet.
+
+    Kept current from create_request and the respond flow, and periodically
+    reconciled with the API so changes made elsewhere are picked up.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._requests = {}  # str(request_id) -> request, oldest first
+        self._changes = None  # adds and discards made while a reconcile streams
+
+    def __len__(self):
+        return len(self._requests)
+
+    def add(self, request):
+        if not request.is_responded:
+            self._requests[str(request.id)] = request
+            if self._changes is not None:
+                self._changes.append((str(request.id), request))
+
+    def discard(self, request_id):
+        self._requests.pop(str(request_id), None)
+        if self._changes is not None:
+            self._changes.append((str(request_id), None))
+
+    def page(self, number, size):
+        """Return the requests on a zero-based page and the number of pages."""
+        pages = max(1, -(-len(self._requests) // size))
+        number = min(max(number, 0), pages - 1)
+        start = number * size
+        requests = list(self._requests.values())[start:start + size]
+        return requests, number, pages
+
+    async def reconcile(self):
+        # A listing that cannot be read completely raises StoreUnavailable and leaves the local view as it is
+        requests = {}
+        self._changes = changes = []
+        try:
+            async for req in iter_requests(is_responded=False):
+                # Stores that ignore the filter also send answered requests
+                if not req.is_responded:
+                    requests[str(req.id)] = req
+        finally:
+            self._changes = None
+        # The listing may predate requests created or answered while it streamed
+        for request_id, request in changes:
+            if request is None:
+                requests.pop(request_id, None)
+            else:
+                requests[request_id] = request
+        self._requests = requests
+        self.ready = True
+
+
+# Shared index used by /requests and the respond flow
+pending_requests = PendingRequests()
+
+# Reconcile with the API in the background; failures are logged and retried next round
+
+
+async def reconcile_forever(store=pending_requests, interval=PENDING_RECONCILE_INTERVAL):
+    while True:
+        try:
+            await store.reconcile()
+        except Exception as e:
+            logging.error(f"Pending requests reconcile failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from telegram.ext import BasePersistence, PersistenceInput
+from config import PERSISTENCE_BACKEND, PERSISTENCE_FILE, PERSISTENCE_REDIS_URL, PERSISTENCE_UPDATE_INTERVAL
+
+# Key-value backends shared by the bot persistence, the routing table and the
+# catalog snapshot. Values are anything json can encode.
+
+
+class MemoryBackend:
+    """Process-local backend; also stands in for Redis in local tests."""
+
+    def __init__(self):
+        self._data = {}
+
+    async def get(self, key):
+        value = self._data.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key, value):
+        self._data[key] = json.dumps(value)
+
+    async def set_many(self, items):
+        for key, value in items.items():
+            await self.set(key, value)
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+    async def items(self, prefix):
+        return {key: json.loads(value) for key, value in self._data.items() if key.startswith(prefix)}
+
+    async def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """Single-file backend; WAL mode lets several workers on one host share it.
+
+    sqlite3 calls block, so they run on a dedicated thread, which also
+    serializes access to the connection. With WAL, synchronous=NORMAL syncs
+    at checkpoints instead of on every commit; a crash of the process loses
+    nothing, a power failure at most the latest commits.
+    """
+
+    def __init__(self, path):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _get(self, key):
+        row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_many(self, rows):
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO kv VALUES (?, ?)", rows)
+
+    def _delete(self, key):
+        with self._conn:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def _items(self, prefix):
+        # Keys are plain ascii prefixes, so a range scan finds them without LIKE escaping
+        rows = self._conn.execute("SELECT key, value FROM kv WHERE key >= ? AND key < ?",
+                                  (prefix, prefix + '\uffff')).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    async def get(self, key):
+        return await self._run(self._get, key)
+
+    async def set(self, key, value):
+        await self.set_many({key: value})
+
+    async def set_many(self, items):
+        # Encoded here, so values changed by the caller afterwards are not written
+        await self._run(self._set_many, [(key, json.dumps(value)) for key, value in items.items()])
+
+    async def delete(self, key):
+        await self._run(self._delete, key)
+
+    async def items(self, prefix):
+        return await self._run(self._items, prefix)
+
+    async def close(self):
+        await self._run(self._conn.close)
+        self._executor.shutdown()
+
+
+class RedisBackend:
+    """Backend on a Redis server, for workers spread over several hosts."""
+
+    def __init__(self, url):
+        try:
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("PERSISTENCE_BACKEND=redis needs the 'redis' package installed")
+        self._redis = redis.asyncio.from_url(url, decode_responses=True)
+
+    async def get(self, key):
+        value = await self._redis.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key, value):
+        await self._redis.set(key, json.dumps(value))
+
+    async def set_many(self, items):
+        if items:
+            await self._redis.mset({key: json.dumps(value) for key, value in items.items()})
+
+    async def delete(self, key):
+        await self._redis.delete(key)
+
+    async def items(self, prefix):
+        keys = [key async for key in self._redis.scan_iter(match=f"{prefix}*")]
+        values = await self._redis.mget(keys) if keys else []
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    async def close(self):
+        await self._redis.close()
+
+
+def make_backend(name=PERSISTENCE_BACKEND):
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'sqlite':
+        return SQLiteBackend(PERSISTENCE_FILE)
+    if name == 'redis':
+        return RedisBackend(PERSISTENCE_REDIS_URL)
+    raise ValueError(f"Unknown PERSISTENCE_BACKEND: {name}")
+
+
+# Shared backend for this process, created on first use so that importing a
+# module does not open the store
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = make_backend()
+    return _backend
+
+# Close the shared backend, e.g. from the application's post_shutdown hook
+
+
+async def close_backend():
+    global _backend
+    if _backend is not None:
+        await _backend.close()
+        _backend = None
+
+
+class BackendPersistence(BasePersistence):
+    """PTB persistence for user_data, chat_data and conversations.
+
+    PTB keeps this data in memory and writes it back every update_interval
+    seconds. So that workers behind a balancer share it, the user's and
+    chat's data are re-read from the backend before each update is handled
+    (PTB's refresh hooks), and the application re-reads the conversation
+    states with refresh_conversations() and writes its changes back after
+    every update (see app.build_application). bot_data is not stored: every
+    worker would overwrite the others' copy as a whole.
+    """
+
+    def __init__(self, backend, update_interval=PERSISTENCE_UPDATE_INTERVAL):
+        super().__init__(store_data=PersistenceInput(bot_data=False, callback_data=False),
+                         update_interval=update_interval)
+        self.backend = backend
+
+    async def _load(self, prefix, parse_key=int):
+        return {parse_key(key[len(prefix):]): value for key, value in (await self.backend.items(prefix)).items()}
+
+    async def get_user_data(self):
+        return await self._load('user_data:')
+
+    async def get_chat_data(self):
+        return await self._load('chat_data:')
+
+    async def get_bot_data(self):
+        return await self.backend.get('bot_data') or {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        prefix = f'conversation:{name}:'
+        return await self._load(prefix, parse_key=lambda key: tuple(json.loads(key)))
+
+    async def update_conversation(self, name, key, new_state):
+        backend_key = f'conversation:{name}:{json.dumps(list(key))}'
+        if new_state is None:
+            await self.backend.delete(backend_key)
+        else:
+            await self.backend.set(backend_key, new_state)
+
+    async def update_user_data(self, user_id, data):
+        await self.backend.set(f'user_data:{user_id}', data)
+
+    async def update_chat_data(self, chat_id, data):
+        await self.backend.set(f'chat_data:{chat_id}', data)
+
+    async def update_bot_data(self, data):
+        await self.backend.set('bot_data', data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        await self.backend.delete(f'user_data:{user_id}')
+
+    async def drop_chat_data(self, chat_id):
+        await self.backend.delete(f'chat_data:{chat_id}')
+
+    async def _refresh(self, key, data):
+        stored = await self.backend.get(key)
+        if stored is not None:
+            data.clear()
+            data.update(stored)
+
+    async def refresh_user_data(self, user_id, user_data):
+        await self._refresh(f'user_data:{user_id}', user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        await self._refresh(f'chat_data:{chat_id}', chat_data)
+
+    async def refresh_conversations(self, conversations, key):
+        """Replace the local state of one conversation key with the stored one.
+
+        conversations maps handler names to PTB's tracked state dicts; the
+        changes are made without tracking, so they are not written back.
+        """
+        for name, states in conversations.items():
+            state = await self.backend.get(f'conversation:{name}:{json.dumps(list(key))}')
+            if state is None:
+                states.data.pop(key, None)
+            else:
+                states.update_no_track({key: state})
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        pass
@@ -0,0 +1,60 @@
+import logging
+from api import iter_messages, StoreUnavailable
+from cache import TTLCache, MISSING
+from concurrency import single_flight
+from config import ROUTES_MIN_REBUILD_INTERVAL, ROUTES_MISS_CACHE_SIZE
+
+
+class RoutingTable:
+    """Maps a user_id to the (request_id, sender_id) of their latest conversation.
+
+    Routes live in the persistence backend, so they survive restarts and
+    every worker sees the latest one. A user without a route is looked up
+    in the API's messages; a user found without a conversation is not looked
+    up again for the rebuild interval.
+    """
+
+    PREFIX = 'routes:'
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._misses = TTLCache(ROUTES_MISS_CACHE_SIZE)
+
+    async def set(self, user_id, request_id, sender_id):
+        await self.backend.set(f'{self.PREFIX}{int(user_id)}', [request_id, sender_id])
+
+    async def lookup(self, user_id):
+        """Return (request_id, sender_id) for a user, or None without an open conversation."""
+        key = f'{self.PREFIX}{int(user_id)}'
+        route = await self.backend.get(key)
+        if route is None and self._misses.get(int(user_id)) is MISSING:
+            await self.rebuild(int(user_id))
+            route = await self.backend.get(key)
+        return tuple(route) if route else None
+
+    @single_flight
+    async def rebuild(self, user_id):
+        """Restore a user's route from their messages in the API."""
+        # The latest conversation is the one with the highest request id
+        latest = None
+        try:
+            async for msg in iter_messages(user_id=user_id):
+                # Stores that ignore the filter also send other users' messages
+                if msg.user_id != user_id or msg.request is None:
+                    continue
+                if latest is None or msg.request > latest.request:
+                    latest = msg
+        except StoreUnavailable as e:
+            logging.warning(f"Route lookup for user {user_id} failed: {e}")
+            return
+        if latest is None:
+            self._misses.set(user_id, True, ROUTES_MIN_REBUILD_INTERVAL)
+            return
+        key = f'{self.PREFIX}{user_id}'
+        # A route set meanwhile, e.g. by a response still waiting in the outbox, is newer than the API's
+        if await self.backend.get(key) is None:
+            await self.backend.set(key, [latest.request, latest.sender_id])
+
+
+# Shared routing table used by handle_message and the respond flow; app.build_application attaches the backend
+routing_table = RoutingTable()
@@ -0,0 +1,71 @@
+import asyncio
+from telegram.ext import BaseUpdateProcessor
+from config import UPDATE_MAX_PENDING
+
+
+def ordering_key(update):
+    """Updates with the same key are processed one at a time, in arrival order."""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        # Inline queries carry no chat, so they are ordered per user
+        return f"user:{update.effective_user.id}"
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently across chats but strictly in order within a chat.
+
+    The conversation states (REQUEST/PHONE/ADDRESS, LIVE_*) are kept per chat,
+    so serializing each chat keeps them consistent while other users are not
+    held up by one slow handler. asyncio locks wake waiters first-come
+    first-served, which preserves arrival order within a chat.
+    """
+
+    def __init__(self, max_concurrent_updates, max_pending_updates=UPDATE_MAX_PENDING):
+        # The base class semaphore bounds the updates accepted at once, waiting
+        # behind their chat or running; only running ones hold one of _slots.
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._locks = {}   # ordering key -> lock
+        self._depths = {}  # ordering key -> updates waiting or running
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self.max_depth_seen = 0
+
+    async def do_process_update(self, update, coroutine):
+        key = ordering_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        depth = self._depths[key] = self._depths.get(key, 0) + 1
+        self.max_depth_seen = max(self.max_depth_seen, depth)
+        try:
+            # The worker slot is taken once the chat lock is held, so updates
+            # queued behind their own chat leave the slots to other chats
+            async with lock:
+                async with self._slots:
+                    await coroutine
+        finally:
+            self._depths[key] -= 1
+            if not self._depths[key]:
+                del self._depths[key]
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self):
+        """Per-chat queue depths: chats with work, deepest chat queue now and ever."""
+        return {
+            'active_chats': len(self._depths),
+            'max_depth': max(self._depths.values(), default=0),
+            'max_depth_seen': self.max_depth_seen,
+            'queued': sum(self._depths.values()),
+        }
@@ -0,0 +1,196 @@
+import asyncio
+import bisect
+import logging
+import re
+from api import get_products, fetch_item_details
+from cache import TTLCache
+from catalog import crawl_models
+from config import SEARCH_INDEX_REFRESH_INTERVAL, SEARCH_MAX_RESULTS, CATALOG_CRAWL_CONCURRENCY, SEARCH_CACHE_SIZE
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Shortest query token that is matched with a one-edit typo tolerance
+TYPO_MIN_LENGTH = 4
+
+# Match scores: exact token, prefix of a token, token within one edit
+EXACT, PREFIX, TYPO = 3, 2, 1
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def _deletes(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+class SearchIndex:
+    """In-process inverted index over item name, brand, model and subcategory."""
+
+    def __init__(self):
+        self.ready = False
+        self._docs = {}         # item_id -> item details
+        self._doc_tokens = {}   # item_id -> set of tokens
+        self._postings = {}     # token -> set of item_ids
+        self._deletes = {}      # token with one char deleted -> set of tokens
+        self._model_items = {}  # model_id -> set of item_ids
+        self._sorted_tokens = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def upsert(self, item):
+        item_id = item.id
+        self.remove(item_id)
+        tokens = set()
+        for field in ('name', 'brand', 'model', 'subcategory'):
+            value = getattr(item, field, None)
+            if value:
+                tokens.update(tokenize(value))
+        self._docs[item_id] = item
+        self._doc_tokens[item_id] = tokens
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = set()
+                self._add_token(token)
+            postings.add(item_id)
+
+    def remove(self, item_id):
+        self._docs.pop(item_id, None)
+        for token in self._doc_tokens.pop(item_id, ()):
+            postings = self._postings[token]
+            postings.discard(item_id)
+            if not postings:
+                del self._postings[token]
+                self._remove_token(token)
+
+    def replace_model(self, model_id, items):
+        """Index a model's current items and drop the ones it no longer lists."""
+        item_ids = {item.id for item in items}
+        for item_id in self._model_items.get(model_id, set()) - item_ids:
+            self.remove(item_id)
+        for item in items:
+            self.upsert(item)
+        self._model_items[model_id] = item_ids
+
+    def drop_models(self, model_ids):
+        """Forget models gone from the catalog and the items no other model lists."""
+        item_ids = set()
+        for model_id in model_ids:
+            item_ids |= self._model_items.pop(model_id, set())
+        for listed in self._model_items.values():
+            item_ids -= listed
+        for item_id in item_ids:
+            self.remove(item_id)
+
+    def _add_token(self, token):
+        self._sorted_tokens = None
+        if len(token) >= TYPO_MIN_LENGTH:
+            for variant in _deletes(token):
+                self._deletes.setdefault(variant, set()).add(token)
+
+    def _remove_token(self, token):
+        self._sorted_tokens = None
+        if len(token) >= TYPO_MIN_LENGTH:
+            for variant in _deletes(token):
+                tokens = self._deletes[variant]
+                tokens.discard(token)
+                if not tokens:
+                    del self._deletes[variant]
+
+    def _prefix_tokens(self, prefix):
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._postings)
+        start = bisect.bisect_left(self._sorted_tokens, prefix)
+        end = bisect.bisect_left(self._sorted_tokens, prefix + '\uffff')
+        return self._sorted_tokens[start:end]
+
+    def _typo_tokens(self, token):
+        if len(token) < TYPO_MIN_LENGTH:
+            return set()
+        # Deletion neighbourhood: covers one insertion, deletion or substitution
+        variants = _deletes(token)
+        matches = set(self._deletes.get(token, ()))
+        for variant in variants:
+            if variant in self._postings:
+                matches.add(variant)
+            matches.update(self._deletes.get(variant, ()))
+        return matches
+
+    def _match(self, token):
+        """Return {item_id: score} for the items matching one query token."""
+        scores = {}
+        for candidate in self._prefix_tokens(token):
+            score = EXACT if candidate == token else PREFIX
+            for item_id in self._postings[candidate]:
+                if scores.get(item_id, 0) < score:
+                    scores[item_id] = score
+        if not scores:
+            for candidate in self._typo_tokens(token):
+                for item_id in self._postings[candidate]:
+                    scores[item_id] = TYPO
+        return scores
+
+    def search(self, query, limit=SEARCH_MAX_RESULTS):
+        """Return the best matching item details; every query token must match."""
+        totals = None
+        for token in tokenize(query):
+            scores = self._match(token)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {item_id: totals[item_id] + score for item_id, score in scores.items() if item_id in totals}
+            if not totals:
+                return []
+        if not totals:
+            return []
+        ranked = sorted(totals, key=lambda item_id: (-totals[item_id], str(self._docs[item_id].name)))
+        return [self._docs[item_id] for item_id in ranked[:limit]]
+
+    async def refresh(self, concurrency=CATALOG_CRAWL_CONCURRENCY):
+        """Crawl the catalog and update the index model by model.
+
+        Item pages and item details share one semaphore, so the whole
+        refresh keeps at most `concurrency` store requests in flight. Models
+        missing from a complete crawl are dropped once the others are indexed.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(getter, *ids):
+            async with semaphore:
+                return await getter(*ids)
+
+        async def index_model(model):
+            items = await fetch(get_products, model.id)
+            # An empty page may be an upstream failure, so keep what we have
+            if not items:
+                return
+            details = await asyncio.gather(*(fetch(fetch_item_details, item.id) for item in items))
+            self.replace_model(model.id, [item_details or item for item, item_details in zip(items, details)])
+
+        models, complete = await crawl_models(concurrency)
+        await asyncio.gather(*(index_model(model) for model in models))
+        if complete:
+            self.drop_models(set(self._model_items) - {model.id for model in models})
+        self.ready = len(self._docs) > 0
+
+
+# Shared index used by inline_search
+catalog_index = SearchIndex()
+
+# Inline search answers keyed by normalized query. Queries are open-ended, so
+# they get their own bound instead of evicting catalog levels.
+search_cache = TTLCache(SEARCH_CACHE_SIZE)
+
+# Keep the index fresh in the background; failures are logged and retried next round
+
+
+async def refresh_index_forever(index=catalog_index, interval=SEARCH_INDEX_REFRESH_INTERVAL):
+    while True:
+        try:
+            await index.refresh()
+            logging.info(f"Search index refreshed: {len(index)} items")
+        except Exception as e:
+            logging.error(f"Search index refresh failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from config import SNAPSHOT_FLUSH_INTERVAL, SNAPSHOT_RELOAD_INTERVAL, CACHE_MAX_ENTRIES
+from models import decode, to_json
+
+
+class Snapshot:
+    """Copy of the catalog cache kept in the persistence backend.
+
+    Up to maxsize entries are held in memory, least recently used first out;
+    put() only marks entries dirty and flush() writes them out in one batch.
+    Loaded entries stay in their plain JSON form until get() first asks for
+    them, so only the entries actually served are decoded into records, and
+    undecoded entries are evicted before decoded ones.
+    """
+
+    PREFIX = 'catalog:'
+
+    def __init__(self, backend=None, maxsize=CACHE_MAX_ENTRIES):
+        self.backend = backend
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # cache key -> records
+        self._raw = OrderedDict()      # cache key -> plain JSON, not decoded yet
+        self._dirty = {}    # cache key -> (value, updated_at)
+        self.updated_at = None
+        self.stale_served = 0
+
+    def __len__(self):
+        return len(self._entries) + len(self._raw)
+
+    async def load(self, since=None):
+        """Read the snapshot from the backend, or only the entries fetched after since.
+
+        Entries read replace the in-memory ones, except those not flushed yet.
+        """
+        try:
+            rows = await self.backend.items(self.PREFIX)
+        except Exception as e:
+            logging.error(f"Could not load catalog snapshot: {e}")
+            return
+        loaded = 0
+        # Oldest first, so the newest entries are the ones kept when trimming
+        for backend_key, (updated_at, value) in sorted(rows.items(), key=lambda row: row[1][0]):
+            if since is not None and updated_at <= since:
+                continue
+            key = tuple(json.loads(backend_key[len(self.PREFIX):]))
+            if key in self._dirty:
+                continue
+            self._entries.pop(key, None)
+            self._raw[key] = value
+            self._raw.move_to_end(key)
+            loaded += 1
+            if self.updated_at is None or updated_at > self.updated_at:
+                self.updated_at = updated_at
+        self._trim()
+        if since is None:
+            logging.info(f"Loaded {loaded} catalog snapshot entries, age {self.age():.0f}s")
+
+    def get(self, key, record=None):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        elif key in self._raw:
+            value = self._raw.pop(key)
+            if record is not None:
+                value = decode(record, value)
+            self._entries[key] = value
+        return value
+
+    def put(self, key, value):
+        now = time.time()
+        self._raw.pop(key, None)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._dirty[key] = (value, now)
+        self.updated_at = now
+        self._trim()
+
+    def _trim(self):
+        # Evicted entries stay in the backend; only the in-memory copy goes
+        while len(self) > self.maxsize:
+            (self._raw if self._raw else self._entries).popitem(last=False)
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        items = {f"{self.PREFIX}{json.dumps(list(key))}": [updated_at, to_json(value)]
+                 for key, (value, updated_at) in dirty.items()}
+        try:
+            await self.backend.set_many(items)
+        except Exception as e:
+            logging.error(f"Could not write catalog snapshot: {e}")
+            # Keep the entries for the next flush unless newer values replaced them
+            for key, entry in dirty.items():
+                self._dirty.setdefault(key, entry)
+
+    def age(self):
+        """Seconds since the newest snapshot entry was fetched from the store."""
+        return time.time() - self.updated_at if self.updated_at is not None else float('inf')
+
+    def stats(self):
+        return {'entries': len(self), 'age_seconds': self.age(), 'stale_served': self.stale_served}
+
+
+# Shared snapshot behind catalog_cache; app.build_application attaches the backend
+catalog_snapshot = Snapshot()
+
+# Write new snapshot entries to the backend in the background
+
+
+async def flush_forever(snapshot=catalog_snapshot, interval=SNAPSHOT_FLUSH_INTERVAL):
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            await snapshot.flush()
+    finally:
+        await snapshot.flush()
+
+# Pick up the entries other workers sharing the backend fetched. An entry is
+# written up to a flush interval after it was fetched, so each reload also
+# looks back that far.
+
+
+async def reload_forever(snapshot=catalog_snapshot, interval=SNAPSHOT_RELOAD_INTERVAL):
+    since = time.time()
+    while True:
+        await asyncio.sleep(interval)
+        started = time.time()
+        await snapshot.load(since - SNAPSHOT_FLUSH_INTERVAL)
+        since = started
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from uuid import uuid4
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from api import check_stock_availability
+from cache import MISSING
+from callbacks import encode, NAV
+from config import (STOCK_POLL_MIN_INTERVAL, STOCK_POLL_MAX_INTERVAL, STOCK_POLL_BACKOFF, STOCK_POLL_CONCURRENCY,
+STOCK_POLL_TICK)
+from dispatcher import dispatcher
+
+
+class StockWatcher:
+    """Subscriptions behind the "Notify me" button of out-of-stock items.
+
+    Each subscription is stored as watch:{item_id}:{user_id} with the item's
+    breadcrumb path and name, so subscriptions made on any worker are seen
+    by the poller. The poller checks each distinct watched item once per
+    round, however many users watch it. Items that stay out of stock are
+    checked less and less often, up to the maximum interval; a new
+    subscription, stamped with the time it was made, brings an item back to
+    the minimum interval. Every change also writes a new token under
+    CHANGED_KEY, and the poller rereads the subscriptions only when that
+    token differs from the one it last loaded. When an item is available
+    again its watchers get a message through the dispatcher and their
+    subscriptions end.
+    """
+
+    PREFIX = 'watch:'
+    CHANGED_KEY = 'watch-changed'
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.checks = 0
+        self.notified = 0
+        self.loads = 0
+        self._watchers = {}  # item_id -> {user_id: subscription}
+        self._schedule = {}  # item_id -> [next check (monotonic), interval, newest subscribed_at]
+        self._loaded_token = MISSING
+
+    async def is_watching(self, item_id, user_id):
+        # Read from the backend: only the poller's worker keeps the subscriptions in memory
+        return await self.backend.get(f'{self.PREFIX}{int(item_id)}:{user_id}') is not None
+
+    async def subscribe(self, path, user_id, name):
+        item_id = int(path[-1])
+        subscription = {'path': list(path), 'name': name, 'subscribed_at': time.time()}
+        await self.backend.set(f'{self.PREFIX}{item_id}:{user_id}', subscription)
+        await self._changed()
+        self._watchers.setdefault(item_id, {})[user_id] = subscription
+        self._schedule[item_id] = [time.monotonic() + STOCK_POLL_MIN_INTERVAL, STOCK_POLL_MIN_INTERVAL,
+                                   subscription['subscribed_at']]
+
+    async def unsubscribe(self, item_id, user_id):
+        item_id = int(item_id)
+        await self.backend.delete(f'{self.PREFIX}{item_id}:{user_id}')
+        await self._changed()
+        self._watchers.get(item_id, {}).pop(user_id, None)
+
+    async def _changed(self):
+        # A fresh token rather than a counter, so concurrent changes on two workers never write the same value
+        await self.backend.set(self.CHANGED_KEY, uuid4().hex)
+
+    async def load(self):
+        watchers = {}
+        for key, subscription in (await self.backend.items(self.PREFIX)).items():
+            item_id, user_id = (int(part) for part in key[len(self.PREFIX):].split(':'))
+            watchers.setdefault(item_id, {})[user_id] = subscription
+        self._watchers = watchers
+        self.loads += 1
+        now = time.monotonic()
+        for item_id, subscriptions in watchers.items():
+            subscribed_at = max(subscription.get('subscribed_at', 0) for subscription in subscriptions.values())
+            schedule = self._schedule.get(item_id)
+            if schedule is None:
+                self._schedule[item_id] = [now, STOCK_POLL_MIN_INTERVAL, subscribed_at]
+            elif subscribed_at > schedule[2]:
+                # Subscribed since the last load, possibly on another worker
+                self._schedule[item_id] = [now + STOCK_POLL_MIN_INTERVAL, STOCK_POLL_MIN_INTERVAL, subscribed_at]
+        for item_id in [item_id for item_id in self._schedule if item_id not in watchers]:
+            del self._schedule[item_id]
+
+    async def poll(self):
+        """Check every watched item that is due and notify the watchers of available ones."""
+        # Read before loading, so a change made during the load leaves a token that is picked up next tick
+        token = await self.backend.get(self.CHANGED_KEY)
+        if token != self._loaded_token:
+            await self.load()
+            self._loaded_token = token
+        now = time.monotonic()
+        due = [item_id for item_id, (next_check, *_) in self._schedule.items() if next_check <= now]
+        semaphore = asyncio.Semaphore(STOCK_POLL_CONCURRENCY)
+
+        async def check(item_id):
+            async with semaphore:
+                # Bypass the short-lived stock cache; the fresh answer also renews it for product cards
+                stock = await check_stock_availability.refresh(item_id)
+            self.checks += 1
+            schedule = self._schedule[item_id]
+            if stock and stock.is_available:
+                await self._notify(item_id)
+                return
+            if stock:
+                schedule[1] = min(schedule[1] * STOCK_POLL_BACKOFF, STOCK_POLL_MAX_INTERVAL)
+            # Failed checks keep the interval and are retried on schedule
+            schedule[0] = time.monotonic() + schedule[1]
+
+        await asyncio.gather(*(check(item_id) for item_id in due))
+
+    async def _notify(self, item_id):
+        watchers = self._watchers.pop(item_id, {})
+        self._schedule.pop(item_id, None)
+        for user_id, subscription in watchers.items():
+            await self.backend.delete(f'{self.PREFIX}{item_id}:{user_id}')
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton("View item", callback_data=encode(NAV, subscription['path']))
+            ]])
+            future = dispatcher.send(user_id, f"✅ {subscription['name']} is back in stock.", reply_markup=reply_markup)
+            # Nobody awaits these; failures are already logged by the dispatcher
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self.notified += 1
+
+    async def run_forever(self, tick=STOCK_POLL_TICK):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                logging.error(f"Stock watch poll failed: {e}")
+            await asyncio.sleep(tick)
+
+    def stats(self):
+        return {'watched_items': len(self._watchers), 'subscriptions': sum(map(len, self._watchers.values())),
+                'checks': self.checks, 'notified': self.notified, 'loads': self.loads}
+
+
+# Shared watcher behind the "Notify me" button; app.build_application attaches the backend
+stock_watcher = StockWatcher()
@@ -0,0 +1,130 @@
+import re
+from string import Formatter
+from cache import TTLCache, MISSING
+from config import PRODUCT_CARD_CACHE_SIZE, PRODUCT_CARD_CACHE_TTL
+
+# Characters that must be escaped anywhere in MarkdownV2 text
+_MARKDOWN_SPECIAL = re.compile(r'([_*\[\]()~`>#+\-=|{}.!\\])')
+
+_HTML_SPECIAL = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
+
+def escape_markdown(text):
+    return _MARKDOWN_SPECIAL.sub(r'\\\1', str(text))
+
+
+def escape_html(text):
+    return str(text).translate(_HTML_SPECIAL)
+
+
+class Template:
+    """Message text whose literal parts are already markup and whose {fields}
+    are escaped for the parse mode when rendered.
+
+    The source is split into literals and field names once, so rendering is a
+    single join. Fields take no format specs; None renders as an empty value.
+    """
+
+    ESCAPES = {'MarkdownV2': escape_markdown, 'HTML': escape_html}
+
+    def __init__(self, source, parse_mode='MarkdownV2'):
+        self.parse_mode = parse_mode
+        self._escape = self.ESCAPES[parse_mode]
+        self._parts = [(literal, field) for literal, field, _, _ in Formatter().parse(source)]
+
+    def render(self, **values):
+        escape = self._escape
+        parts = []
+        for literal, field in self._parts:
+            parts.append(literal)
+            if field is not None:
+                value = values[field]
+                parts.append(escape(value) if value is not None else '')
+        return ''.join(parts)
+
+
+PRODUCT_CARD = Template(
+    "📱 *{name}*\n\n"
+    "*Brand:* {brand}\n"
+    "*Model:* {model}\n"
+    "*Subcategory:* {subcategory}\n"
+    "*Stock Available:* {available}\n"
+)
+
+PRODUCT_INFO = Template(
+    "*Product Name:* {name}\n"
+    "*Brand:* {brand}\n"
+    "*Model:* {model}\n"
+)
+
+PRODUCT_UNAVAILABLE = Template("Product details not available\\.")
+
+NEW_REQUEST = Template(
+    "📨 *New Request*\n\n"
+    "*Date:* {date}\n"
+    "*Username:* {username}\n"
+    "*Name:* {name}\n"
+    "*Phone:* {phone}\n"
+    "*Address:* {address}\n\n"
+    "🛍️ *Product Information*\n"
+)
+
+NEW_LIVE_AGENT_REQUEST = Template(
+    "📨 *New Live Agent Request*\n\n"
+    "*Username:* {username}\n"
+    "*Name:* {name}\n"
+    "*Phone:* {phone}\n"
+    "*Address:* {address}\n\n"
+    "📄 *Additional Information:* {additional_text}"
+)
+
+PENDING_HEADER = Template("📨 *Unresponded Requests* \\({page}/{pages}\\)\n\n")
+
+PENDING_ENTRY = Template(
+    "❓ *Request ID:* {id}\n"
+    "👤 *User ID:* {user_id}\n"
+    "📄 *Additional Text:* {additional_text}\n\n"
+)
+
+# Rendered product cards keyed by (item id, stock availability). Each entry
+# keeps the item it was rendered from, so changed details render a new card.
+product_card_cache = TTLCache(PRODUCT_CARD_CACHE_SIZE)
+
+
+def product_card(item, available):
+    key = (item.id, available)
+    cached = product_card_cache.get(key)
+    if cached is not MISSING and cached[0] == item:
+        return cached[1]
+    text = PRODUCT_CARD.render(name=item.name, brand=item.brand, model=item.model, subcategory=item.subcategory,
+                               available="Yes" if available else "No")
+    product_card_cache.set(key, (item, text), PRODUCT_CARD_CACHE_TTL)
+    return text
+
+
+def split_message(text, limit):
+    """Split rendered text into chunks of at most limit characters.
+
+    Chunks end at a blank line, else at a line break. Templates open and
+    close their entities within a line, so these cuts never split an
+    entity; a single overlong line is cut anywhere but inside an escape.
+    """
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind('\n\n', 0, limit - 1)
+        if cut > 0:
+            cut += 2
+        else:
+            cut = text.rfind('\n', 0, limit)
+            if cut > 0:
+                cut += 1
+            else:
+                cut = limit
+                # An odd run of backslashes before the cut ends in an unfinished escape
+                backslashes = len(text[:cut]) - len(text[:cut].rstrip('\\'))
+                cut -= backslashes % 2
+        chunks.append(text[:cut])
+        text = text[cut:]
+    if text:
+        chunks.append(text)
+    return chunks
@@ -0,0 +1,151 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from telegram import Update
+from metrics import registry
+from config import (WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET_TOKEN,
+WEBHOOK_MAX_CONNECTIONS, WEBHOOK_QUEUE_SIZE, WEBHOOK_ENQUEUE_TIMEOUT, WEBHOOK_MAX_BODY_SIZE)
+
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+           503: 'Service Unavailable'}
+
+
+class WebhookServer:
+    """Minimal HTTP server that receives Telegram updates for an Application.
+
+    Each update is handed to the application's update processor as its own
+    task, so one chat waiting on its lock never holds up another. At most
+    queue_size updates are received but unprocessed; when none frees up within
+    the enqueue timeout the request is answered with 503, so Telegram keeps
+    the update and delivers it again later instead of it being dropped.
+    """
+
+    def __init__(self, application, path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET_TOKEN, queue_size=WEBHOOK_QUEUE_SIZE,
+                 enqueue_timeout=WEBHOOK_ENQUEUE_TIMEOUT):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.enqueue_timeout = enqueue_timeout
+        self.received = 0
+        self.rejected = 0
+        self._server = None
+        self._room = asyncio.Semaphore(queue_size)
+        self._tasks = set()
+        registry.register_stats('webhook', self.stats)
+
+    async def start(self, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        logging.info(f"Webhook server listening on {host}:{port}{self.path}")
+
+    async def stop(self):
+        """Stop accepting updates, then finish the ones already received."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _submit(self, update):
+        # Go through the application's update processor, which decides how updates run concurrently;
+        # create_task reports failures to the application's error handlers
+        task = self.application.create_task(self._process(update), update=update)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, update):
+        try:
+            await self.application.update_processor.process_update(update, self.application.process_update(update))
+        finally:
+            self._room.release()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            # Telegram keeps connections alive, so serve requests until it closes
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                status = await self._handle_request(*request)
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Length: 0\r\n\r\n".encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if length > WEBHOOK_MAX_BODY_SIZE:
+            raise ValueError("request body too large")
+        body = await reader.readexactly(length) if length else b''
+        return method, path, headers, body
+
+    async def _handle_request(self, method, path, headers, body):
+        if path != self.path:
+            return 404
+        if method != 'POST':
+            return 405
+        if self.secret_token and not hmac.compare_digest(headers.get('x-telegram-bot-api-secret-token', ''), self.secret_token):
+            return 403
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            return 400
+
+        try:
+            await asyncio.wait_for(self._room.acquire(), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return 503
+        self.received += 1
+        self._submit(update)
+        return 200
+
+    def stats(self):
+        return {'queue_depth': len(self._tasks), 'received': self.received, 'rejected': self.rejected}
+
+# Run an application in webhook mode until SIGINT/SIGTERM, mirroring the
+# lifecycle hooks that run_polling calls
+
+
+async def run_webhook(application):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    server = WebhookServer(application)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET_TOKEN or None,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        await server.start()
+        await stop.wait()
+    finally:
+        await server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)